@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import tracemalloc
+from contextlib import redirect_stdout
+from os import devnull
+from os.path import join
+from time import perf_counter
+
+import loader
+from decoder import PayloadDecoder, plan_ranges
+from generator import generate
+
+# Time and memory profile of the loader stages on synthetic exports of growing size
+
+BENCHMARK_SCALES = [ 1000, 10000, 100000, 1000000 ]
+BENCHMARK_FILES = 4
+
+
+def _measure ( func, repeat=1, memory=True ) :
+    # ( best time in seconds, peak of traced memory in bytes or None, result of the last run )
+    seconds = None
+    for _ in range( repeat ) :
+        start = perf_counter()
+        result = func()
+        elapsed = perf_counter() - start
+        seconds = elapsed if seconds is None else min( seconds, elapsed )
+    peak = None
+    if memory :
+        # traced on its own run, tracemalloc slows down the allocations
+        tracemalloc.start()
+        result = func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return seconds, peak, result
+
+
+def _to_dict ( labels_trees, structs_dict ) :
+    labels_dict = { }
+    for labels_tree in labels_trees :
+        loader.to_dict( labels_tree, None, labels_dict, structs_dict )
+    return labels_dict
+
+def _to_csv ( folder, labels_list ) :
+    for i, ( k, l ) in enumerate( labels_list.items() ) :
+        loader.to_csv( i + 1, join( folder, k ), l )
+
+
+def run ( scale, folder, repeat=1, memory=True, seed=0 ) :
+    leaves = generate( folder, leaves=scale, files=BENCHMARK_FILES, seed=seed )
+    filenames = loader.list_label_files( folder )
+    results = [ ]
+    def stage ( name, func ) :
+        seconds, peak, result = _measure( func, repeat, memory )
+        results.append( { 'scale': scale, 'leaves': leaves, 'stage': name, 'seconds': seconds, 'peak_bytes': peak } )
+        return result
+    structs_tree = stage( 'load_structs', lambda: loader.load_structs( join( folder, loader.STRUCTS_FILE ) ) )
+    labels_trees = stage( 'load_labels', lambda: [ loader.load_labels( filename ) for filename in filenames ] )
+    structs_dict = stage( 'struct_catalog', lambda: loader.VarStruct.getStructCatalog( structs_tree ) )
+    labels_dict = stage( 'to_dict', lambda: _to_dict( labels_trees, structs_dict ) )
+    layout = loader.VarLayout( structs_dict )
+    stage( 'to_json', lambda: loader.to_json( labels_dict, layout ) )
+    labels_list = stage( 'to_list', lambda: loader.to_list( labels_dict ) )
+    stage( 'to_csv', lambda: _to_csv( folder, labels_list ) )
+    table, names = stage( 'to_table', lambda: loader.to_table( labels_dict, layout ) )
+    plan = stage( 'compile_plan', lambda: loader.compile_plan( table, names ) )
+    decoder = stage( 'compile_decoder', lambda: PayloadDecoder( table, plan_ranges( plan ) ) )
+    # one scan, the payload of every frame of the read plan
+    payload = ( bytes( range( 256 ) ) * ( decoder.size // 256 + 1 ) )[:decoder.size]
+    stage( 'decode', lambda: decoder.decode( payload ) )
+    return results
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser( description='Benchmark the loader stages on synthetic GX Works exports' )
+    parser.add_argument( '--scales', default=','.join( [ str(s) for s in BENCHMARK_SCALES ] ),
+                         help='comma separated number of leaves of each run' )
+    parser.add_argument( '--repeat', type=int, default=1, help='timed runs of each stage, the best one is kept' )
+    parser.add_argument( '--no-memory', action='store_true', help='skip the traced memory runs' )
+    parser.add_argument( '--seed', type=int, default=0 )
+    parser.add_argument( '--output', help='results file, stdout if missing' )
+    args = parser.parse_args()
+    # comments are part of the GOT export
+    loader.ENABLE_COMMENTS = True
+    results = [ ]
+    for scale in [ int(s) for s in args.scales.split( ',' ) ] :
+        with tempfile.TemporaryDirectory() as folder, open( devnull, 'w' ) as null, redirect_stdout( null ) :
+            results.extend( run( scale, folder, args.repeat, not args.no_memory, args.seed ) )
+    report = { 'python': platform.python_version(), 'platform': platform.platform(), 'results': results }
+    if args.output :
+        with open( args.output, 'w' ) as output_file :
+            json.dump( report, output_file, indent=4 )
+    else :
+        json.dump( report, sys.stdout, indent=4 )
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import json
+import sys
+import numpy as NP
+from time import perf_counter
+
+from loader import SLMP_COMPATIBLE_DEVICES, TYPE_SIZE, load_npy, table_name
+
+# Vectorized decoding of read payloads into the values of the label table written by loader.py --npy.
+# Everything that depends only on the labels and on the device ranges of the payload is computed once by
+# PayloadDecoder, decoding a payload is then one gather per type and alignment, whatever the number of labels.
+
+TYPE_NAMES = list( TYPE_SIZE )  # TYPE_IDS of loader.py, id -> type
+DECODE_DTYPES = {
+    'INT': '<i2',
+    'DINT': '<i4',
+    'WORD': '<u2',
+    'DWORD': '<u4',
+    'REAL': '<f4',
+    'LREAL': '<f8'
+}
+# bits of one point of each device code, 0 for the codes that are not devices
+UNIT_BITS = NP.zeros( 256, dtype=NP.int64 )
+for _device in SLMP_COMPATIBLE_DEVICES.values() :
+    UNIT_BITS[ _device['code'] ] = int( _device['size'] * 8 )
+ADDRESS_SHIFT = 40  # device code and bit offset in a single sortable key
+
+
+def frame_ranges ( frame ) :
+    # ( code, head, bytes ) of the device ranges of a read frame of loader.compile_plan, in payload order.
+    # Blocks are read in words, bit blocks included, random points are words or dwords
+    if frame['cmd'] == 'block' :
+        return [ ( b['code'], b['index'], b['points'] * 2 ) for b in frame.get( 'words', [ ] ) + frame.get( 'bits', [ ] ) ]
+    return [ ( p['code'], p['index'], 2 ) for p in frame.get( 'words', [ ] ) ] + \
+           [ ( p['code'], p['index'], 4 ) for p in frame.get( 'dwords', [ ] ) ]
+
+def plan_ranges ( plan ) :
+    # ranges of every frame of a read plan, for the payloads of the frames joined in order
+    return [ r for frame in plan['frames'] for r in frame_ranges( frame ) ]
+
+def table_elements ( table ) :
+    # ( row, element, device bit, bits of the element ) of every element of every row of the label table,
+    # the bits of word devices are counted from bit 0 of the device
+    lengths = table['dimension'][:,:,1] - table['dimension'][:,:,0] + 1
+    counts = NP.where( NP.arange( 3 ) < table['ndim'][:,None], lengths, 1 ).prod( axis=1 ).astype( NP.int64 )
+    element_bits = ( table['size'] * 8 / counts ).astype( NP.int64 )
+    unit = UNIT_BITS[ table['code'] ]
+    start = NP.where( unit == 1, table['index'].astype( NP.int64 ),
+                      table['index'] * unit + NP.maximum( table['sub'], 0 ) )
+    rows = NP.repeat( NP.arange( len( table ) ), counts )
+    firsts = NP.cumsum( counts ) - counts
+    elements = NP.arange( len( rows ) ) - NP.repeat( firsts, counts )
+    return rows, elements, NP.repeat( start, counts ) + elements * element_bits[ rows ], element_bits[ rows ]
+
+def uncovered_elements ( table, ranges ) :
+    # ( rows, elements ) of table_elements that are not entirely inside the device ranges, like the elements that
+    # a read plan leaves out. Elements split between two adjacent ranges are covered
+    rows, elements, bit, bits = table_elements( table )
+    keys = table['code'][ rows ].astype( NP.int64 ) << ADDRESS_SHIFT | bit
+    covered = NP.zeros( len( keys ), dtype=bool )
+    if ranges and len( keys ) :
+        range_code = NP.array( [ r[0] for r in ranges ], dtype=NP.int64 )
+        starts = NP.array( [ r[1] for r in ranges ], dtype=NP.int64 ) * UNIT_BITS[ range_code ]
+        starts |= range_code << ADDRESS_SHIFT
+        ends = starts + NP.array( [ r[2] for r in ranges ], dtype=NP.int64 ) * 8
+        order = NP.argsort( starts, kind='stable' )
+        starts, ends = starts[ order ], ends[ order ]
+        # union of the ranges, a range starting after the end of all the previous ones starts a new interval
+        reach = NP.maximum.accumulate( ends )
+        firsts = NP.flatnonzero( NP.concatenate( ( [ True ], starts[1:] > reach[:-1] ) ) )
+        starts, ends = starts[ firsts ], NP.maximum.reduceat( ends, firsts )
+        r = NP.searchsorted( starts, keys, 'right' ) - 1
+        covered = ( r >= 0 ) & ( keys + bits <= ends[ NP.maximum( r, 0 ) ] )
+    return rows[ ~covered ], elements[ ~covered ]
+
+
+class PayloadDecoder :
+    # values of the label elements inside the device ranges of a payload. Elements that are not entirely inside the
+    # ranges are left out, a label split between frames is decoded partly by the decoder of each frame.
+    # decode() returns { type: array of values }, ordered by row and element as in rows[type] and elements[type].
+    # Strings are raw bytes, 'S' arrays drop the trailing zeros, wstring are utf-16 encoded.
+
+    def __init__ ( self, table, ranges ) :
+        self.table = table
+        self.size = sum( [ r[2] for r in ranges ] )
+        self.rows = { }
+        self.elements = { }
+        self.ids = { }  # position of the elements in table_elements, an id for each element of each label
+        self.gathers = { }  # type -> ( dtype, count, [ ( scratch, view dtype, phase, destination, source ) ] )
+        self.bits = None  # ( byte, shift ) of the bools
+        self.skipped = 0  # elements inside a range that can't be decoded, not byte aligned
+        self.scratch = None  # payload bytes of the elements split between ranges, gathered before decoding
+        rows, elements, bit, bits = table_elements( table )
+        codes = table['code'][ rows ]
+        payload_bit = self._locate( codes, bit, bits, ranges )
+        # elements split between ranges, e.g. at the frame limits of the plan, are copied in the scratch buffer
+        # which is decoded as if it followed the payload
+        split = NP.flatnonzero( ( payload_bit < 0 ) & ( bit % 8 == 0 ) & ( bits % 8 == 0 ) )
+        if len( split ) :
+            nbytes = bits[ split ] >> 3
+            firsts = NP.cumsum( nbytes ) - nbytes
+            within = NP.arange( nbytes.sum() ) - NP.repeat( firsts, nbytes )
+            byte_bit = self._locate( NP.repeat( codes[ split ], nbytes ), NP.repeat( bit[ split ], nbytes ) + within * 8,
+                                     NP.full( len( within ), 8 ), ranges )
+            found = NP.minimum.reduceat( byte_bit, firsts ) >= 0 if len( byte_bit ) else NP.zeros( 0, bool )
+            if found.any() :
+                keep = NP.repeat( found, nbytes )
+                self.scratch = byte_bit[ keep ] >> 3
+                payload_bit[ split[ found ] ] = ( self.size + NP.cumsum( nbytes[ found ] ) - nbytes[ found ] ) * 8
+        inside = payload_bit >= 0
+        types = table['type'][ rows ]
+        for type_id in NP.unique( types[ inside ] ) :
+            vartype = TYPE_NAMES[ type_id ]
+            mask = inside & ( types == type_id )
+            if vartype != 'BOOL' :
+                aligned = mask & ( payload_bit % 8 == 0 )
+                self.skipped += int( NP.count_nonzero( mask & ~aligned ) )
+                mask = aligned
+                if not mask.any() :
+                    continue
+            self.rows[ vartype ] = rows[ mask ]
+            self.elements[ vartype ] = elements[ mask ]
+            self.ids[ vartype ] = NP.flatnonzero( mask )
+            if vartype == 'BOOL' :
+                self.bits = ( payload_bit[ mask ] >> 3, ( payload_bit[ mask ] & 7 ).astype( NP.uint8 ) )
+            elif vartype in DECODE_DTYPES :
+                self.gathers[ vartype ] = self._gathers( NP.dtype( DECODE_DTYPES[ vartype ] ), payload_bit[ mask ] >> 3 )
+            else :
+                self.gathers[ vartype ] = self._string_gathers( payload_bit[ mask ] >> 3, bits[ mask ] >> 3 )
+
+    def _locate ( self, codes, bit, bits, ranges ) :
+        # bit of each element in the payload, -1 if it isn't entirely inside one of the ranges
+        result = NP.full( len( bit ), -1, dtype=NP.int64 )
+        if not ranges or not len( bit ) :
+            return result
+        codes = codes.astype( NP.int64 )
+        range_code = NP.array( [ r[0] for r in ranges ], dtype=NP.int64 )
+        range_unit = UNIT_BITS[ range_code ]
+        range_start = NP.array( [ r[1] for r in ranges ], dtype=NP.int64 ) * range_unit
+        range_end = range_start + NP.array( [ r[2] for r in ranges ], dtype=NP.int64 ) * 8
+        range_payload = ( NP.cumsum( [ r[2] for r in ranges ] ) - [ r[2] for r in ranges ] ) * 8
+        order = NP.argsort( range_code << ADDRESS_SHIFT | range_start, kind='stable' )
+        keys = ( range_code << ADDRESS_SHIFT | range_start )[ order ]
+        r = NP.searchsorted( keys, codes << ADDRESS_SHIFT | bit, 'right' ) - 1
+        valid = r >= 0
+        r = order[ NP.maximum( r, 0 ) ]
+        valid &= ( range_code[ r ] == codes ) & ( bit + bits <= range_end[ r ] )
+        result[ valid ] = ( range_payload[ r ] + bit - range_start[ r ] )[ valid ]
+        return result
+
+    def _gathers ( self, dtype, offsets ) :
+        # the payload, or the scratch buffer, is viewed as dtype once for every alignment of the elements
+        scratch = offsets >= self.size
+        offsets = NP.where( scratch, offsets - self.size, offsets )
+        phases = offsets % dtype.itemsize
+        gathers = [ ]
+        for buffer, phase in sorted( set( zip( scratch.tolist(), phases.tolist() ) ) ) :
+            destination = NP.flatnonzero( ( scratch == buffer ) & ( phases == phase ) )
+            gathers.append( ( buffer, dtype, phase, destination, ( offsets[ destination ] - phase ) // dtype.itemsize ) )
+        return dtype, len( offsets ), gathers
+
+    def _string_gathers ( self, offsets, lengths ) :
+        # one gather per element length and alignment, every value is returned as long as the longest one
+        gathers = [ ]
+        for length in NP.unique( lengths ) :
+            mask = lengths == length
+            dtype, _, length_gathers = self._gathers( NP.dtype( 'S{}'.format( length ) ), offsets[ mask ] )
+            indexes = NP.flatnonzero( mask )
+            gathers.extend( [ ( b, d, p, indexes[ dest ], src ) for b, d, p, dest, src in length_gathers ] )
+        return NP.dtype( 'S{}'.format( lengths.max() ) ), len( offsets ), gathers
+
+    #-------------------------------------------------------------------------------------------------------------------
+    def decode ( self, payload ) :
+        # payload is any bytes-like object, or a list of them joined in order
+        if isinstance( payload, ( list, tuple ) ) :
+            payload = b''.join( payload )
+        payload = memoryview( payload ).cast( 'B' )
+        if len( payload ) != self.size :
+            raise ValueError( 'payload size {} instead of {}'.format( len( payload ), self.size ) )
+        result = { }
+        data = NP.frombuffer( payload, dtype=NP.uint8 )
+        buffers = [ payload, data[ self.scratch ] if self.scratch is not None else b'' ]
+        if self.bits is not None :
+            result['BOOL'] = ( data[ self.bits[0] ] >> self.bits[1] & 1 ).view( bool )
+        for vartype, ( dtype, count, gathers ) in self.gathers.items() :
+            views = [ ( NP.frombuffer( buffers[ b ], d, ( len( buffers[ b ] ) - phase ) // d.itemsize, phase ), dest, src )
+                      for b, d, phase, dest, src in gathers ]
+            if len( views ) == 1 and views[0][0].dtype == dtype :
+                result[ vartype ] = views[0][0][ views[0][2] ]
+                continue
+            result[ vartype ] = NP.empty( count, dtype )
+            for view, dest, src in views :
+                result[ vartype ][ dest ] = view[ src ]
+        return result
+
+    def label ( self, values, row ) :
+        # decoded elements of a row of the table, shaped as the label if all of them are inside the payload
+        for vartype, rows in self.rows.items() :
+            start, stop = NP.searchsorted( rows, [ row, row + 1 ] )
+            if start == stop :
+                continue
+            value = values[ vartype ][ start:stop ]
+            ndim = int( self.table[ row ]['ndim'] )
+            shape = [ int( u - l + 1 ) for l, u in self.table[ row ]['dimension'][:ndim] ]
+            if vartype == 'wstring' :
+                value = NP.array( [ v.ljust( len( v ) + len( v ) % 2, b'\0' ).decode( 'utf-16-le', 'replace' ) for v in value ] )
+            elif vartype == 'string' :
+                value = NP.array( [ v.decode( 'ascii', 'replace' ) for v in value ] )
+            if ndim and len( value ) == NP.prod( shape ) :
+                return value.reshape( shape )
+            return value if ndim or len( value ) > 1 else value[0]
+        return None
+
+    def path ( self, names, row, element ) :
+        # name of an element of a row, with its array index like loader.expand_leaves
+        name = table_name( names, self.table[ row ] )
+        ndim = int( self.table[ row ]['ndim'] )
+        if not ndim :
+            return name
+        dimension = self.table[ row ]['dimension'][:ndim]
+        index = NP.unravel_index( element, [ int( u - l + 1 ) for l, u in dimension ] )
+        return name + '[{}]'.format( ','.join( [ str( int( i + l ) ) for i, ( l, _ ) in zip( index, dimension ) ] ) )
+
+    def to_dict ( self, values, names ) :
+        # { label name : value } of every decoded row, meant for inspection, not for every scan
+        result = { }
+        for rows in self.rows.values() :
+            for row in NP.unique( rows ) :
+                value = self.label( values, row )
+                result[ table_name( names, self.table[ row ] ) ] = value.tolist() if hasattr( value, 'tolist' ) else value
+        return result
+
+
+#-----------------------------------------------------------------------------------------------------------------------
+async def main ( args ) :
+    # import here, the decoder itself has no need of a connection
+    from slmp import SLMPPool
+    table, names = load_npy( args.labels )
+    with open( args.labels + '_plan.json' ) as plan_file :
+        plan = json.load( plan_file )['read']
+    start = perf_counter()
+    decoder = PayloadDecoder( table, plan_ranges( plan ) )
+    result = { 'compile_seconds': perf_counter() - start, 'skipped': decoder.skipped,
+               'elements': sum( [ len( r ) for r in decoder.rows.values() ] ) }
+    async with SLMPPool( args.host, args.port, args.connections ) as pool :
+        for _ in range( args.repeat ) :
+            start = perf_counter()
+            payloads = await pool.readPlan( plan )
+            read = perf_counter() - start
+            values = decoder.decode( payloads )
+            decode = perf_counter() - start - read
+            result['read_seconds'] = min( result.get( 'read_seconds', read ), read )
+            result['decode_seconds'] = min( result.get( 'decode_seconds', decode ), decode )
+    if args.values :
+        result['values'] = decoder.to_dict( values, names )
+    return result
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser( description='Read the access plan of the labels from a PLC and decode it' )
+    parser.add_argument( 'labels', help='labels file written by loader.py --npy --plan, without extension' )
+    parser.add_argument( 'host' )
+    parser.add_argument( '-p', '--port', type=int, default=5007 )
+    parser.add_argument( '-c', '--connections', type=int, default=4 )
+    parser.add_argument( '--repeat', type=int, default=1, help='timed scans, the best one is kept' )
+    parser.add_argument( '--values', action='store_true', help='print the value of every label' )
+    args = parser.parse_args()
+    json.dump( asyncio.run( main( args ) ), sys.stdout, indent=4 )
+    print()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import json
+import sys
+import numpy as NP
+from time import time, perf_counter
+
+from loader import load_npy
+from decoder import PayloadDecoder, plan_ranges, table_elements
+
+# Change detection between successive scans of the read plan, only the elements that changed are reported.
+# Every element of every label has an id, its position in decoder.table_elements, bools are single elements so
+# the bits of M/X/Y/B devices are reported one by one.
+
+# absolute deadbands, a value is reported when it moved more than this from the last reported value
+DELTA_DEADBANDS = {
+    'REAL': 0.0,
+    'LREAL': 0.0
+}
+
+
+def record_dtype ( value_dtype ) :
+    return NP.dtype( [ ( 'time', '<f8' ), ( 'id', '<u4' ), ( 'value', value_dtype ) ] )
+
+
+class DeltaEngine :
+    # keeps the last reported value of every element, update() returns { type: records of the changed elements }
+
+    def __init__ ( self, decoder, deadbands=None, initial=True ) :
+        self.decoder = decoder
+        self.deadbands = { **DELTA_DEADBANDS, **( deadbands or { } ) }
+        self.initial = initial  # report every element on the first scan
+        self.payload = None
+        self.last = { }
+        self.counters = { 'scans': 0, 'unchanged_scans': 0, 'records': 0 }
+
+    def _changed ( self, vartype, new, old ) :
+        deadband = self.deadbands.get( vartype, 0 )
+        if new.dtype.kind != 'f' :
+            return new != old
+        # NaN is a change only when it appears or disappears
+        nan = NP.isnan( new )
+        if deadband :
+            changed = NP.abs( new - old ) > deadband
+        else :
+            changed = new != old
+        return ( changed & ~nan ) | ( nan != NP.isnan( old ) )
+
+    def update ( self, payload, timestamp=None ) :
+        if isinstance( payload, ( list, tuple ) ) :
+            payload = b''.join( payload )
+        payload = bytes( payload )
+        timestamp = time() if timestamp is None else timestamp
+        self.counters['scans'] += 1
+        # the raw snapshots are compared first, nothing has to be decoded for a scan without changes
+        if payload == self.payload :
+            self.counters['unchanged_scans'] += 1
+            return { }
+        values = self.decoder.decode( payload )
+        records = { }
+        for vartype, new in values.items() :
+            old = self.last.get( vartype )
+            if old is None :
+                self.last[ vartype ] = new.copy()
+                if not self.initial :
+                    continue
+                changed = NP.arange( len( new ) )
+            else :
+                changed = NP.flatnonzero( self._changed( vartype, new, old ) )
+                if not len( changed ) :
+                    continue
+                old[ changed ] = new[ changed ]
+            result = NP.empty( len( changed ), record_dtype( new.dtype ) )
+            result['time'] = timestamp
+            result['id'] = self.decoder.ids[ vartype ][ changed ]
+            result['value'] = new[ changed ]
+            records[ vartype ] = result
+            self.counters['records'] += len( changed )
+        self.payload = payload
+        return records
+
+
+def iter_records ( records ) :
+    # ( timestamp, id, value ) of the records of every type, ordered by id
+    merged = [ ( int( r['id'] ), float( r['time'] ), r['value'].item() ) for rs in records.values() for r in rs ]
+    for element, timestamp, value in sorted( merged ) :
+        if isinstance( value, bytes ) :
+            value = value.decode( 'latin-1' )
+        yield timestamp, element, value
+
+
+#-----------------------------------------------------------------------------------------------------------------------
+def _parse_deadbands ( deadbands ) :
+    # [ 'REAL=0.1' ] -> { 'REAL': 0.1 }
+    return { k: float( v ) for k, v in [ d.split( '=' ) for d in deadbands ] }
+
+async def main ( args, output ) :
+    from slmp import SLMPPool
+    table, names = load_npy( args.labels )
+    with open( args.labels + '_plan.json' ) as plan_file :
+        plan = json.load( plan_file )['read']
+    decoder = PayloadDecoder( table, plan_ranges( plan ) )
+    engine = DeltaEngine( decoder, _parse_deadbands( args.deadband ), not args.no_initial )
+    rows, elements, _, _ = table_elements( table )
+    async with SLMPPool( args.host, args.port, args.connections ) as pool :
+        scan = 0
+        while not args.scans or scan < args.scans :
+            start = perf_counter()
+            for timestamp, element, value in iter_records( engine.update( await pool.readPlan( plan ) ) ) :
+                label = decoder.path( names, rows[ element ], elements[ element ] ) if args.paths else element
+                output.write( json.dumps( [ timestamp, label, value ] ) + '\n' )
+            scan += 1
+            await asyncio.sleep( max( 0, args.interval - ( perf_counter() - start ) ) )
+    return engine.counters
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser( description='Poll the access plan of the labels and write only the changes' )
+    parser.add_argument( 'labels', help='labels file written by loader.py --npy --plan, without extension' )
+    parser.add_argument( 'host' )
+    parser.add_argument( '-p', '--port', type=int, default=5007 )
+    parser.add_argument( '-c', '--connections', type=int, default=4 )
+    parser.add_argument( '--interval', type=float, default=1.0, help='seconds between scans' )
+    parser.add_argument( '--scans', type=int, default=0, help='number of scans, 0 for no limit' )
+    parser.add_argument( '--deadband', action='append', default=[ ], help='TYPE=value, e.g. REAL=0.01' )
+    parser.add_argument( '--no-initial', action='store_true', help="don't write every value on the first scan" )
+    parser.add_argument( '--paths', action='store_true', help='write the element path instead of its id' )
+    parser.add_argument( '--output', help='records file, json lines of [ time, id, value ], stdout if missing' )
+    args = parser.parse_args()
+    output = open( args.output, 'w' ) if args.output else sys.stdout
+    try :
+        counters = asyncio.run( main( args, output ) )
+    finally :
+        if args.output :
+            output.close()
+    print( json.dumps( counters ), file=sys.stderr )
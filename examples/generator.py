@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+import argparse
+import random
+from os import makedirs
+from os.path import join
+from xml.sax.saxutils import escape
+
+# Synthetic GX Works exports, same layout as the files read by loader.py
+
+XML_HEADER = '<?xml version="1.0" encoding="utf-8"?>\n<project xmlns="http://www.plcopen.org/xml/tc6_0201">\n'
+XML_FOOTER = '</project>\n'
+
+SCALAR_TYPES = [ 'BOOL', 'INT', 'DINT', 'WORD', 'DWORD', 'REAL', 'LREAL', 'string', 'wstring' ]
+TYPE_WORDS = { 'BOOL': 0, 'INT': 1, 'DINT': 2, 'WORD': 1, 'DWORD': 2, 'REAL': 2, 'LREAL': 4 }
+STRING_LENGTH = [ 8, 16, 32 ]
+ARRAY_LENGTH = [ 2, 4, 8, 10 ]
+
+GENERATOR_ARGS = {
+    'leaves': 1000,  # number of scalar elements to generate, arrays and structs expanded
+    'files': 1,  # number of label files, sdt.xml excluded
+    'groups': 2,  # number of label groups per file
+    'depth': 2,  # struct nesting depth, 0 for no structs
+    'structs': 3,  # number of struct types per nesting level
+    'members': 6,  # number of members of each struct type
+    'dims': 2,  # maximum number of array dimensions, up to 3
+    'arrays': 0.2,  # share of array labels
+    'struct_labels': 0.3,  # share of struct labels
+    'comments': 0.3,  # share of variables with comments
+    'retain': 0.1,  # share of retain groups
+    'constant': 0.05,  # share of constant groups
+    'access': 0.8,  # share of variables with external device access
+    'seed': 0
+}
+
+
+class Generator :
+    def __init__ ( self, **kwargs ) :
+        self.args = { **GENERATOR_ARGS, **kwargs }
+        self.rng = random.Random( self.args['seed'] )
+        self.word = 0
+        self.bit = 0
+        self.structs = { }  # name -> [ ( name, type, dimension, length ) ]
+        self.leaves = { }  # name -> number of scalar elements
+        self.levels = [ ]
+
+    #-----------------------------------------------------------------------------------------------------------------
+    def _dimension ( self, max_dims ) :
+        return [ [ 0, self.rng.choice( ARRAY_LENGTH ) - 1 ] for _ in range( self.rng.randint( 1, max_dims ) ) ]
+
+    def _type_xml ( self, vartype, dimension, length ) :
+        if vartype in ( 'string', 'wstring' ) :
+            base = '<{} length="{}"/>'.format( vartype, length )
+        elif vartype in TYPE_WORDS :
+            base = '<{}/>'.format( vartype )
+        else :
+            base = '<derived name="{}"/>'.format( vartype )
+        if not dimension :
+            return '<type>{}</type>'.format( base )
+        return '<type><array>{}<baseType>{}</baseType></array></type>'.format(
+            ''.join( [ '<dimension lower="{}" upper="{}"/>'.format( *pair ) for pair in dimension ] ), base )
+
+    def _comments_xml ( self, name ) :
+        if self.rng.random() >= self.args['comments'] :
+            return ''
+        comments = ''.join( [ '<comment number="{}"><html>{} comment {}</html></comment>'.format( i, escape( name ), i )
+                              for i in range( 1, self.rng.randint( 1, 3 ) + 1 ) ] )
+        return '<data name="comments"><variableComments>{}</variableComments></data>'.format( comments )
+
+    def _scalar ( self ) :
+        vartype = self.rng.choice( SCALAR_TYPES )
+        return vartype, self.rng.choice( STRING_LENGTH ) if vartype in ( 'string', 'wstring' ) else 0
+
+    def _length ( self, dimension ) :
+        length = 1
+        for pair in dimension :
+            length *= pair[1] - pair[0] + 1
+        return length
+
+    def _address ( self, vartype, dimension, length ) :
+        # allocate consecutive devices, bits in M and everything else in D
+        count = self._length( dimension )
+        if vartype == 'BOOL' :
+            address = 'M{}'.format( self.bit )
+            self.bit += count
+            return address
+        address = 'D{}'.format( self.word )
+        if vartype == 'string' :
+            self.word += count * ( length + length % 2 ) // 2
+        elif vartype == 'wstring' :
+            self.word += count * length
+        else :
+            self.word += count * TYPE_WORDS[ vartype ]
+        return address
+
+    #-----------------------------------------------------------------------------------------------------------------
+    def make_structs ( self ) :
+        for level in range( self.args['depth'] ) :
+            names = [ ]
+            for k in range( self.args['structs'] ) :
+                name = 'ST_{}_{}'.format( level, k )
+                members = [ ]
+                for m in range( self.args['members'] ) :
+                    if level and m < 2 :
+                        # nested structs are never arrays, their members are assigned one by one
+                        members.append( ( 'm{}'.format( m ), self.rng.choice( self.levels[-1] ), [ ], 0 ) )
+                        continue
+                    vartype, length = self._scalar()
+                    dimension = [ [ 0, self.rng.choice( ARRAY_LENGTH ) - 1 ] ] \
+                        if self.rng.random() < self.args['arrays'] and vartype not in ( 'string', 'wstring' ) else [ ]
+                    members.append( ( 'm{}'.format( m ), vartype, dimension, length ) )
+                self.structs[ name ] = members
+                self.leaves[ name ] = sum( [ self.leaves.get( t, 1 ) * self._length( d ) for _, t, d, _ in members ] )
+                names.append( name )
+            self.levels.append( names )
+
+    def write_structs ( self, filename ) :
+        with open( filename, 'w' ) as f :
+            f.write( XML_HEADER + '<types><dataTypes>\n' )
+            for name, members in self.structs.items() :
+                f.write( '<dataType name="{}"><baseType><struct>\n'.format( name ) )
+                for member, vartype, dimension, length in members :
+                    f.write( '<variable name="{}">{}<addData>{}</addData></variable>\n'.format(
+                        member, self._type_xml( vartype, dimension, length ), self._comments_xml( member ) ) )
+                f.write( '</struct></baseType></dataType>\n' )
+            f.write( '</dataTypes></types>\n' + XML_FOOTER )
+
+    #-----------------------------------------------------------------------------------------------------------------
+    def _members_xml ( self, typename ) :
+        result = [ ]
+        for member, vartype, dimension, length in self.structs[ typename ] :
+            if vartype in self.structs :
+                result.append( '<member name="{}"><struct>{}</struct></member>'.format(
+                    member, self._members_xml( vartype ) ) )
+            else :
+                result.append( '<member name="{}" address="{}"/>'.format(
+                    member, self._address( vartype, dimension, length ) ) )
+        return ''.join( result )
+
+    def _elements_xml ( self, typename, dimension ) :
+        if not dimension :
+            return self._members_xml( typename )
+        return ''.join( [ '<element index="{}">{}</element>'.format( i, self._elements_xml( typename, dimension[1:] ) )
+                          for i in range( dimension[0][0], dimension[0][1] + 1 ) ] )
+
+    def _variable_xml ( self, name, constant ) :
+        # ( xml, number of leaves )
+        if self.levels and self.rng.random() < self.args['struct_labels'] :
+            vartype, length = self.rng.choice( self.levels[-1] ), 0
+        else :
+            vartype, length = self._scalar()
+        dimension = [ ]
+        if self.rng.random() < self.args['arrays'] :
+            dimension = self._dimension( min( self.args['dims'], 2 if vartype in ( 'string', 'wstring' ) else 3 ) )
+        data = [ ]
+        if self.rng.random() < self.args['access'] :
+            data.append( '<data name="access"><variableExternalDeviceAccess isAccess="true"/></data>' )
+        data.append( self._comments_xml( name ) )
+        address = ''
+        initial = ''
+        if constant :
+            initial = '<initialValue><simpleValue value="{}"/></initialValue>'.format(
+                '1' if vartype in TYPE_WORDS else "''" )
+        elif vartype in self.structs :
+            content = self._elements_xml( vartype, dimension )
+            if dimension :
+                content = '<array>{}</array>'.format( content )
+            data.append( '<data name="struct"><variableStructDeviceAssignment>{}</variableStructDeviceAssignment></data>'
+                         .format( content ) )
+        else :
+            address = ' address="{}"'.format( self._address( vartype, dimension, length ) )
+        xml = '<variable name="{}"{}>{}{}<addData>{}</addData></variable>\n'.format(
+            name, address, self._type_xml( vartype, dimension, length ), initial, ''.join( data ) )
+        return xml, self.leaves.get( vartype, 1 ) * self._length( dimension )
+
+    def write_labels ( self, filenames, leaves ) :
+        groups = [ ( filename, 'G{}_{}'.format( f, g ) ) for f, filename in enumerate( filenames )
+                   for g in range( self.args['groups'] ) ]
+        outputs = { filename: open( filename, 'w' ) for filename in filenames }
+        try :
+            for f in outputs.values() :
+                f.write( XML_HEADER + '<instances><configurations><configuration name="cfg">\n' )
+            count = 0
+            for i, ( filename, group ) in enumerate( groups ) :
+                attrib = ''
+                constant = self.rng.random() < self.args['constant']
+                if constant :
+                    attrib = ' constant="true"'
+                elif self.rng.random() < self.args['retain'] :
+                    attrib = ' retain="true"'
+                outputs[ filename ].write( '<globalVars name="{}"{}>\n'.format( group, attrib ) )
+                # spread the leaves evenly between the groups
+                target = leaves * ( i + 1 ) // len( groups )
+                v = 0
+                while count < target :
+                    xml, n = self._variable_xml( 'v{}'.format( v ), constant )
+                    outputs[ filename ].write( xml )
+                    count += n
+                    v += 1
+                outputs[ filename ].write( '</globalVars>\n' )
+            for f in outputs.values() :
+                f.write( '</configuration></configurations></instances>\n' + XML_FOOTER )
+        finally :
+            for f in outputs.values() :
+                f.close()
+        return count
+
+
+def generate ( folder, **kwargs ) :
+    # write sdt.xml and the label files in folder, returns the number of leaves generated
+    makedirs( folder, exist_ok=True )
+    generator = Generator( **kwargs )
+    generator.make_structs()
+    generator.write_structs( join( folder, 'sdt.xml' ) )
+    filenames = [ join( folder, 'labels_{}.xml'.format( i ) ) for i in range( generator.args['files'] ) ]
+    return generator.write_labels( filenames, generator.args['leaves'] )
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser( description='Generate a synthetic GX Works label export' )
+    parser.add_argument( 'folder', help='output folder' )
+    for key, value in GENERATOR_ARGS.items() :
+        parser.add_argument( '--' + key.replace( '_', '-' ), type=type( value ), default=value )
+    args = parser.parse_args()
+    print( generate( args.folder, **{ k: v for k, v in vars( args ).items() if k != 'folder' } ) )
@@ -4,8 +4,22 @@ import json
 import numpy as NP
 import csv
 import sys
-from os import listdir
-from os.path import isfile, join
+import argparse
+import hashlib
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from os import listdir, cpu_count, makedirs, replace, stat, remove, rmdir, utime
+from os.path import isfile, isdir, join, basename
+from itertools import product
+from contextlib import contextmanager
+from dataclasses import dataclass
+from operator import attrgetter
+from time import perf_counter
+try :
+    import resource
+except ImportError :
+    resource = None
 
 SLMP_COMPATIBLE_DEVICES = {
     # Digital input outputs
@@ -66,6 +80,20 @@ TYPE_SIZE = {
 	"wstring": 2
 }
 
+# Alignment of each type inside a struct, in bytes as TYPE_SIZE
+TYPE_ALIGN = {
+	"BOOL": 0.125,
+	"INT": 2,
+	"DINT": 4,
+	"WORD": 2,
+	"DWORD": 4,
+	"REAL": 4,
+	"LREAL": 4,
+	"string": 2,
+	"wstring": 2
+}
+STRUCT_ALIGN = 2
+
 PLC_TO_GOT_TYPES = {
     'BOOL': 'Bit',
     'INT': 'Signed BIN16',
@@ -104,16 +132,325 @@ COMMENT_SIZE = 16
 IS_TEST = True
 ENABLE_COMMENTS = False
 
+STRUCTS_FILE = 'sdt.xml'
+LABELS_FILE = 'labels.json'
+CACHE_FOLDER = '.labels_cache'
+CACHE_SIZE = 256 * 1024 * 1024
+CACHE_VERSION = 3
+CACHE_NAME = 'plc_labels'  # subfolder of the cache folder, nothing out of it is ever removed
+CACHE_MARKER = 'CACHEDIR.TAG'
+CACHE_DIGEST = re.compile( r'[0-9a-f]{64}' )  # struct hash folder names
+CACHE_TAG = 'Signature: 8a477f597d28d172789f06886806bc55\n# build cache of loader.py, see https://bford.info/cachedir/\n'
+
+DEVICE_TYPES = { v['code']: k for k, v in SLMP_COMPATIBLE_DEVICES.items() }
+
+# SLMP frame limits, same as SLMP_SIZE in lib/const.js
+SLMP_SIZE = {
+    'BATCH': 949,  # maximum number of words in a single request
+    'RANDOM': 94,  # maximum number of words/dwords in a random access
+    'BLOCK': 60  # maximum number of blocks in a block access
+}
+# Cost model of the access plan, in bytes on the wire
+SLMP_COST = {
+    'FRAME': 64,  # request and response headers, TCP/IP included
+    'DEVICE': 4,  # device code and index
+    'POINTS': 2  # number of points of a block
+}
+PLAN_GAP = 2
+
+TYPE_IDS = { t: i for i, t in enumerate( TYPE_SIZE ) }
+DEVICE_NAMES = { name: sys.intern( name ) for name in SLMP_COMPATIBLE_DEVICES }
+
+# Device addresses, device prefix, index in the base of the device and optional hex bit index like W1A.3
+ADDRESS_PATTERN = re.compile( r'(\D*)(\d[^.]*)(?:\.(.*))?', re.ASCII | re.DOTALL )
+DECIMAL_DIGITS = '0123456789'
+HEX_DIGITS = '0123456789ABCDEFabcdef'
+ADDRESS_PREFIX = 4  # longest device prefix
+ADDRESS_DIGITS = 10  # longest index
+ADDRESS_OK, ADDRESS_NO_INDEX, ADDRESS_DEVICE, ADDRESS_INDEX, ADDRESS_SUB, ADDRESS_ELEMENT = range( 6 )
+ADDRESS_ERRORS = [ None, 'no device index', 'unsupported device', 'invalid index', 'invalid bit index',
+                   'element out of bounds' ]
+ADDRESS_DTYPE = NP.dtype( [
+    ( 'code', 'u1' ),  # SLMP device code
+    ( 'index', 'i8' ),  # device index
+    ( 'sub', 'i1' ),  # bit index inside a word device, -1 if not bit addressed
+    ( 'unit', 'u1' ),  # bits per device point, 1 for bit devices
+    ( 'error', 'u1' )  # ADDRESS_ERRORS id, ADDRESS_OK when decoded
+] )
+LABEL_DTYPE = NP.dtype( [
+    ( 'code', 'u1' ),  # SLMP device code
+    ( 'index', 'u4' ),  # device index
+    ( 'sub', 'i1' ),  # bit index inside a word device, -1 if not bit addressed
+    ( 'size', 'f8' ),  # size in bytes, bits are 0.125 as in TYPE_SIZE
+    ( 'type', 'u1' ),  # TYPE_IDS
+    ( 'ndim', 'u1' ),
+    ( 'dimension', 'i4', (3,2) ),  # [lower,upper] pairs, [0,-1] if unused
+    ( 'name', 'u8' ),  # offset in the name table
+    ( 'length', 'u4' )  # length of the name in the name table
+] )
+
 NAME_JOINER = '_'
 ARRAY_JOINER = '_'
 COMMENT_JOINER = ' : '
+PATH_JOINER = '.'
+
+# SQLite catalog of the labels, leaves are the scalar elements of expand_leaves
+SQLITE_SCHEMA = '''
+CREATE TABLE groups ( id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE );
+CREATE TABLE variables ( id INTEGER PRIMARY KEY, group_id INTEGER NOT NULL REFERENCES groups ( id ),
+    name TEXT NOT NULL, path TEXT NOT NULL, type TEXT NOT NULL, dimension TEXT NOT NULL, size REAL,
+    address TEXT, const INTEGER, retain INTEGER, access INTEGER, comments TEXT );
+CREATE TABLE struct_types ( id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, size INTEGER, align INTEGER );
+CREATE TABLE struct_members ( id INTEGER PRIMARY KEY, struct_id INTEGER NOT NULL REFERENCES struct_types ( id ),
+    name TEXT NOT NULL, type TEXT NOT NULL, dimension TEXT NOT NULL, size REAL, offset INTEGER, comments TEXT );
+CREATE TABLE leaves ( id INTEGER PRIMARY KEY, variable_id INTEGER NOT NULL REFERENCES variables ( id ),
+    path TEXT NOT NULL, type TEXT NOT NULL, address TEXT NOT NULL, device TEXT NOT NULL,
+    device_code INTEGER NOT NULL, device_index INTEGER NOT NULL, device_sub INTEGER );
+CREATE INDEX variables_path ON variables ( path );
+CREATE INDEX variables_group ON variables ( group_id );
+CREATE INDEX struct_members_struct ON struct_members ( struct_id );
+CREATE INDEX leaves_path ON leaves ( path );
+CREATE INDEX leaves_variable ON leaves ( variable_id );
+CREATE INDEX leaves_device ON leaves ( device_code, device_index );
+'''
+
+
+def _peak_rss ( ) :
+    # peak rss of the process in kB, 0 where resource is missing
+    return resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss if resource is not None else 0
+
+class Stats :
+    # wall time, memory and counters of the pipeline stages, nothing is collected unless enabled. The memory of a
+    # stage is how much it raised the peak rss of the process, 0 when an earlier stage already went higher
+    def __init__ ( self ) :
+        self.enabled = False
+        self.reset()
+    def reset ( self ) :
+        self.stages = { }
+        self.counters = { }
+        self.files = { }
+    @contextmanager
+    def stage ( self, name ) :
+        if not self.enabled :
+            yield
+            return
+        start = perf_counter()
+        rss = _peak_rss()
+        try :
+            yield
+        finally :
+            self.add( name, perf_counter() - start, rss_growth=_peak_rss() - rss )
+    def add ( self, name, seconds, calls=1, rss_growth=0 ) :
+        if not self.enabled :
+            return
+        stage = self.stages.setdefault( name, { 'seconds': 0, 'calls': 0, 'peak_rss_growth_kb': 0 } )
+        stage['seconds'] += seconds
+        stage['calls'] += calls
+        stage['peak_rss_growth_kb'] = max( stage['peak_rss_growth_kb'], rss_growth )
+    def count ( self, name, n=1 ) :
+        if self.enabled :
+            self.counters[ name ] = self.counters.get( name, 0 ) + n
+    def file ( self, filename, seconds ) :
+        if self.enabled :
+            self.files[ filename ] = seconds
+    def snapshot ( self ) :
+        return { 'stages': self.stages, 'counters': self.counters }
+    def merge ( self, snapshot ) :
+        # add the stats of a worker process
+        for name, stage in snapshot['stages'].items() :
+            own = self.stages.setdefault( name, { 'seconds': 0, 'calls': 0, 'peak_rss_growth_kb': 0 } )
+            own['seconds'] += stage['seconds']
+            own['calls'] += stage['calls']
+            own['peak_rss_growth_kb'] = max( own['peak_rss_growth_kb'], stage['peak_rss_growth_kb'] )
+        for name, n in snapshot['counters'].items() :
+            self.counters[ name ] = self.counters.get( name, 0 ) + n
+    def report ( self ) :
+        result = { **self.snapshot(), 'files': self.files }
+        if resource is not None :
+            result['peak_rss_kb'] = resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+            result['peak_rss_children_kb'] = resource.getrusage( resource.RUSAGE_CHILDREN ).ru_maxrss
+        return result
+    def summary ( self ) :
+        lines = [ '{:<16}{:>12}{:>8}{:>22}'.format( 'stage', 'seconds', 'calls', 'peak rss growth (kB)' ) ]
+        for name, stage in self.stages.items() :
+            lines.append( '{:<16}{:>12.3f}{:>8}{:>22}'.format( name, stage['seconds'], stage['calls'],
+                                                               stage['peak_rss_growth_kb'] ) )
+        lines.extend( [ '{:<16}{:>12}'.format( name, n ) for name, n in self.counters.items() ] )
+        lines.extend( [ '{:<16}{:>12.3f}'.format( basename( filename ), seconds ) for filename, seconds in self.files.items() ] )
+        return '\n'.join( lines )
+
+STATS = Stats()
+
+
+class Record :
+    # base of the slotted records of the label model, with the mapping interface of the dicts they replace.
+    # A field is missing when it is None, the fields are listed in __slots__ order like the keys of the dicts were
+    __slots__ = ( )
+    def __getitem__ ( self, key ) :
+        value = getattr( self, key ) if key in self.__slots__ else None
+        if value is None :
+            raise KeyError( key )
+        return value
+    def __setitem__ ( self, key, value ) :
+        if key not in self.__slots__ :
+            raise KeyError( key )
+        setattr( self, key, value )
+    def __delitem__ ( self, key ) :
+        self[ key ] = None
+    def __contains__ ( self, key ) :
+        return key in self.__slots__ and getattr( self, key ) is not None
+    def __iter__ ( self ) :
+        return iter( self.asdict() )
+    def __len__ ( self ) :
+        return len( self.asdict() )
+    def get ( self, key, default=None ) :
+        value = getattr( self, key ) if key in self.__slots__ else None
+        return default if value is None else value
+    def keys ( self ) :
+        return self.asdict().keys()
+    def values ( self ) :
+        return self.asdict().values()
+    def items ( self ) :
+        return self.asdict().items()
+    def update ( self, items=( ), **kwargs ) :
+        if isinstance( items, Record ) :
+            items = items.asdict()
+        for k, v in ( items.items() if isinstance( items, dict ) else items ) :
+            self[k] = v
+        for k, v in kwargs.items() :
+            self[k] = v
+    def clear ( self ) :
+        for k in self.__slots__ :
+            setattr( self, k, None )
+    def copy ( self ) :
+        return type( self )( *self._values( self ) )
+    def asdict ( self, keys=None ) :
+        # plain dict of the fields, for json, in the order of keys if given
+        result = { }
+        for k in self.__slots__ if keys is None else keys :
+            v = getattr( self, k )
+            if v is not None :
+                result[k] = v
+        return result
+
+def record ( cls ) :
+    # slotted dataclass of the label model, every field defaults to None
+    cls = dataclass( slots=True )( cls )
+    cls._values = attrgetter( *cls.__slots__ )
+    return cls
+
+@record
+class Variable ( Record ) :
+    # a label, its fields in the order of labels.json. Labels have no index and struct members are not compacted,
+    # both records still have the same fields to be walked alike
+    index : list = None
+    name : str = None
+    const : bool = None
+    retain : bool = None
+    access : bool = None
+    type : str = None
+    dimension : list = None
+    value : object = None
+    size : int = None
+    comments : tuple = None
+    struct : list = None
+    address : str = None
+    element : list = None
+    strides : list = None
+
+@record
+class Member ( Record ) :
+    # a struct member, in a struct definition or in the 'struct' of a label
+    index : list = None
+    name : str = None
+    struct : list = None
+    address : str = None
+    type : str = None
+    dimension : list = None
+    value : object = None
+    size : int = None
+    comments : tuple = None
+    element : list = None
+    strides : list = None
+    def define ( self, definition ) :
+        # copy the type of the struct member definition
+        self.type = definition.type
+        self.dimension = definition.dimension
+        self.value = definition.value
+        self.size = definition.size
+        self.comments = definition.comments
+
+# fields compared between the elements of an array of structs, besides their index, struct and address
+_member_type = attrgetter( 'name', 'type', 'dimension', 'value', 'size', 'comments' )
+
+@record
+class Address ( Record ) :
+    # a decoded device address
+    source : str = None
+    type : str = None
+    code : int = None
+    sub : int = None
+    index : int = None
+    size : float = None
+
+@record
+class TypeInfo ( Record ) :
+    source : str = None
+    size : int = None
+
+# variables without comments share the same empty comments
+EMPTY_COMMENTS = ( '', ) * COMMENT_SIZE
+# key order of the addresses written in _leaves.json
+LEAF_ADDRESS_KEYS = ( 'type', 'code', 'size', 'index', 'sub', 'source' )
+
+def _json_record ( obj ) :
+    # json default of the records
+    if isinstance( obj, Record ) :
+        return obj.asdict()
+    raise TypeError( '{} is not JSON serializable'.format( type( obj ).__name__ ) )
+
+def _to_records ( items, kind ) :
+    # records of the plain variables of a list, nested lists included
+    result = [ ]
+    for item in items :
+        if type( item ) == list :
+            result.append( _to_records( item, kind ) )
+        elif type( item ) == dict :
+            result.append( to_record( item, kind ) )
+        else :
+            result.append( item )
+    return result
+
+def to_record ( var, kind=Variable ) :
+    # record of a plain variable, like the ones read back from the build cache, strings are interned again
+    temp = kind()
+    temp.update( var )
+    if temp.name is not None :
+        temp.name = sys.intern( temp.name )
+    if temp.type is not None :
+        temp.type = sys.intern( temp.type )
+    if temp.comments is not None :
+        temp.comments = tuple( temp.comments )
+        if temp.comments == EMPTY_COMMENTS :
+            temp.comments = EMPTY_COMMENTS
+    if type( temp.struct ) == list :
+        temp.struct = _to_records( temp.struct, Member )
+    if temp.element is not None :
+        temp.element = _to_records( temp.element, Member )
+    return temp
+
+def to_records ( labels_dict ) :
+    return { k: [ to_record( var ) for var in l ] for k, l in labels_dict.items() }
 
 
 def element_iterator ( element ) :
     if type( element ) == list :
         for el in element :
-            for res in element_iterator ( el ) :
-                yield res
+            # one generator per nested list, not per element
+            if type( el ) == list :
+                yield from element_iterator( el )
+            else :
+                yield el
     else :
         yield element
 
@@ -132,20 +469,20 @@ class VarType :
     def getVarType ( tree, value=0, dimension=[] ) :
         if len(tree) != 1:
             raise Exception('VarType : xml : wrong tree length, there should be only one child')
-        if tree[0].tag in PLC_TO_GOT_TYPES :
-            return { 'type': tree[0].tag, 'dimension': dimension, 'value': VarType.getInitialValue(tree[0].tag, value), 'size': _dimension_to_len(dimension) }
+        if tree[0].tag in PLC_TO_GOT_TYPES and tree[0].tag not in ( 'string', 'wstring' ) :
+            return { 'type': sys.intern( tree[0].tag ), 'dimension': dimension, 'value': VarType.getInitialValue(tree[0].tag, value), 'size': _dimension_to_len(dimension) }
         if tree[0].tag in UNSUPPORTED_TYPES :
             return { }
         match tree[0].tag:
             case 'wstring':
                 if len(dimension) > 2:
                     raise Exception('VarType : wstring : unsupported dimension, strings takes up a dimension')
-                return { 'type': tree[0].tag, 'dimension': dimension, 'value': value or '', 'size': int(tree[0].attrib.get('length')) }
+                return { 'type': sys.intern( tree[0].tag ), 'dimension': dimension, 'value': value or '', 'size': int(tree[0].attrib.get('length')) }
             case 'string':
                 if len(dimension) > 2:
                     raise Exception('VarType : string unsupported dimension, strings takes up a dimension')
                 l = int(tree[0].attrib.get('length'))
-                return { 'type': tree[0].tag, 'dimension': dimension, 'value': value or '', 'size': l+l%2 }
+                return { 'type': sys.intern( tree[0].tag ), 'dimension': dimension, 'value': value or '', 'size': l+l%2 }
             case 'array':
                 dimension = [ [ int(val) for val in dim.attrib.values() ] for dim in tree[0].findall( 'dimension' ) ]
                 if len(dimension) > 3 or len(dimension) < 1 :
@@ -154,11 +491,12 @@ class VarType :
             case 'derived':
                 if tree[0].attrib['name'] in UNSUPPORTED_TYPES :
                     return { }
-                return { 'type': tree[0].attrib['name'], 'dimension': dimension }
+                return { 'type': sys.intern( tree[0].attrib['name'] ), 'dimension': dimension }
     def getInitialValue ( vartype='INT', value=0 ) :
         match vartype:
             case 'BOOL':
-                return bool(value)
+                # exports write TRUE/FALSE
+                return str(value).upper() not in ( '', '0', 'FALSE' )
             case 'INT' | 'DINT' | 'WORD' | 'DWORD':
                 return int(value)
             case 'REAL' | 'LREAL':
@@ -172,9 +510,10 @@ class VarAddress :
             match node.tag :
                 case 'member' :
                     if 'address' in node.attrib :
-                        addr.append( { 'name': node.attrib['name'], 'address': node.attrib['address'] } )
+                        addr.append( Member( name=sys.intern( node.attrib['name'] ), address=node.attrib['address'] ) )
                     elif len(node) == 1 and node[0].tag == 'struct' :
-                        addr.append( { 'name': node.attrib['name'], 'struct': VarAddress.getVarAddress( node[0] ) } )
+                        addr.append( Member( name=sys.intern( node.attrib['name'] ),
+                                             struct=VarAddress.getVarAddress( node[0] ) ) )
                 case 'array' :
                     # find the dimension of the array, like above for VarType
                     # populate the array if possible with the content of the tags "element"
@@ -185,130 +524,328 @@ class VarAddress :
                     for el_0 in node :  # outer array ( 0 )
                         index[0] = int( el_0.attrib['index'] )
                         if el_0[0].tag != 'element' :
-                            arr.append( [ {'index':index[:1],**v} for v in VarAddress.getVarAddress( el_0 ) ] )
+                            arr.append( VarAddress._setIndex( VarAddress.getVarAddress( el_0 ), index[:1] ) )
                             continue
                         arr_1 = [ ]
                         for el_1 in el_0 :  # middle array ( 1 )
                             index[1] = int( el_1.attrib['index'] )
                             if el_1[0].tag != 'element' :
-                                arr_1.append( [ {'index':index[:2],**v} for v in VarAddress.getVarAddress( el_1 ) ] )
+                                arr_1.append( VarAddress._setIndex( VarAddress.getVarAddress( el_1 ), index[:2] ) )
                                 continue
                             arr_2 = [ ]
                             for el_2 in el_1 :  # inner array ( 2 )
                                 index[2] = int( el_2.attrib['index'] )
-                                arr_2.append( [ {'index':index,**v} for v in VarAddress.getVarAddress( el_2 ) ] )
+                                arr_2.append( VarAddress._setIndex( VarAddress.getVarAddress( el_2 ), index[:] ) )
                             arr_1.append( arr_2 )
                         arr.append( arr_1 )
                     return arr
         return addr
+    def _setIndex ( members, index ) :
+        # the members of an array element share its index
+        for member in members :
+            member.index = index
+        return members
 
 
 class VarComments :
-    def getVarComments ( tree, comment_list ) :
+    def getVarComments ( tree, comment_list=EMPTY_COMMENTS ) :
+        comment_list = list( comment_list )
         for comment in tree.findall( 'comment' ) :
             comment_list[ int(comment.attrib['number']) - 1 ] = comment.find('html').text
-        return comment_list
+        return tuple( comment_list )
 
 
 class VarStruct :
+    def getStructMembers ( node ) :
+        struct = node.find( 'baseType' ).find( 'struct' )
+        temp_list = [ ]
+        for var in struct.findall( 'variable' ) :
+            # clean temp variables
+            xml_comments = None
+            # collect useful data nodes
+            for dt in var.find( 'addData' ) :
+                if dt[0].tag == 'variableComments' :
+                    xml_comments = dt[0]
+            # get variable type
+            temp_var = Member( name=sys.intern( var.attrib['name'] ),
+                               **VarType.getVarType(var.find('type'),_initial_value(var),[]) )
+            if temp_var.type is None :
+                continue
+            # get variable comments
+            if ENABLE_COMMENTS :
+                temp_var.comments = EMPTY_COMMENTS
+                if xml_comments :
+                    temp_var.comments = VarComments.getVarComments( xml_comments )
+            temp_list.append( temp_var )
+        return temp_list
     def getAllVarStructs ( tree ) :
         structs = { }
         for node in tree :
-            struct = node.find( 'baseType' ).find( 'struct' )
-            temp_list = [ ]
-            for var in struct.findall( 'variable' ) :
-                # clean temp variables
-                xml_comments = None
-                # collect useful data nodes
-                for dt in var.find( 'addData' ) :
-                    if dt[0].tag == 'variableComments' :
-                        xml_comments = dt[0]
-                # get variable type
-                temp_var = { 'name': var.attrib['name'], **VarType.getVarType(var.find('type'),_initial_value(var),[]) }
-                if 'type' not in temp_var :
-                    continue
-                # get variable comments
-                if ENABLE_COMMENTS :
-                    temp_var[ 'comments' ] = [''] * COMMENT_SIZE
-                    if xml_comments :
-                        temp_var[ 'comments' ] = VarComments.getVarComments( xml_comments, temp_var[ 'comments' ] )
-                temp_list.append( temp_var )
-            structs[ node.attrib.get( 'name', '' ) ] = temp_list
+            structs[ node.attrib.get( 'name', '' ) ] = VarStruct.getStructMembers( node )
         return structs
+    def getStructCatalog ( tree ) :
+        # type name -> { member name -> member definition }, build it once and share it between label files
+        catalog = { }
+        with STATS.stage( 'struct_catalog' ) :
+            for node in tree :
+                catalog[ node.attrib.get( 'name', '' ) ] = { m.name: m for m in VarStruct.getStructMembers( node ) }
+        STATS.count( 'structs', len( catalog ) )
+        return catalog
     def getVarStruct ( tree, typename ) :
         for node in tree:
             if node.attrib.get( 'name', '' ) == typename:
-                struct = node.find( 'baseType' ).find( 'struct' )
-                temp_list = [ ]
-                for var in struct.findall( 'variable' ) :
-                    # clean temp variables
-                    xml_comments = None
-                    # collect useful data nodes
-                    for dt in var.find( 'addData' ) :
-                        if dt[0].tag == 'variableComments' :
-                            xml_comments = dt[0]
-                    # get variable type
-                    temp_var = { 'name': var.attrib['name'], **VarType.getVarType(var.find('type'),_initial_value(var),[]) }
-                    if 'type' not in temp_var :
-                        continue
-                    # get variable comments
-                    if ENABLE_COMMENTS :
-                        temp_var[ 'comments' ] = [''] * COMMENT_SIZE
-                        if xml_comments :
-                            temp_var[ 'comments' ] = VarComments.getVarComments( xml_comments, temp_var[ 'comments' ] )
-                    temp_list.append( temp_var )
-                return temp_list
+                return VarStruct.getStructMembers( node )
         return {}
-    def getVarStructTree ( tree, structs, var ) :
+    def getVarStructTree ( structs, var ) :
         depth = 0
-        if 'type' not in var :
+        if var.type is None :
             #print('ERROR : {}'.format(var))
             return 0
-        if var[ 'type' ] in PLC_TO_GOT_TYPES :
+        if var.type in PLC_TO_GOT_TYPES :
             return 1
-        elif var[ 'type' ] not in structs.keys() :
-            #print( '{} : not found'.format(var['type']) )
-            structs[ var['type'] ] = VarStruct.getVarStruct( tree, var['type'] )
-        indices = [ dimension[1]-dimension[0]+1 for dimension in var[ 'dimension' ] ]
-        if type( var.get('struct',None) ) == list :
-            for temp_var in element_iterator( var['struct'] ) :
-                found = False
-                for temp_struct in structs[ var['type'] ] :
-                    if temp_struct['name'] == temp_var['name']:
-                        temp_var.update( temp_struct )
-                        found = True
-                        break
-                if not found :
-                    print( "ERROR : ({},{}) : {} : not found".format(var.get('name',''),var.get('type',''),temp_var.get('name','')) )
+        members = structs.get( var.type )
+        if members is None :
+            # the catalog holds every type of the dataTypes tree, remember the miss
+            #print( '{} : not found'.format(var.type) )
+            STATS.count( 'struct_misses' )
+            members = structs[ var.type ] = { }
+        else :
+            STATS.count( 'struct_hits' )
+        if type( var.struct ) == list :
+            for temp_var in element_iterator( var.struct ) :
+                temp_struct = members.get( temp_var.name )
+                if temp_struct is None :
+                    STATS.count( 'member_misses' )
+                    print( "ERROR : ({},{}) : {} : not found".format(var.name or '',var.type,temp_var.name or '') )
                 else :
-                    depth = max( depth, VarStruct.getVarStructTree ( tree, structs, temp_var ) )
+                    temp_var.define( temp_struct )
+                    if temp_var.type in PLC_TO_GOT_TYPES :
+                        depth = max( depth, 1 )
+                    else :
+                        depth = max( depth, VarStruct.getVarStructTree ( structs, temp_var ) )
         return depth + 1
+    # Arrays of structs whose elements are evenly spaced keep only their first element, as 'element', and the
+    # stride in device points of each of its leaves, as 'strides'. The other elements are rebuilt on demand.
+    def _structElements ( struct, depth ) :
+        if depth == 0 :
+            yield struct
+            return
+        for temp_struct in struct :
+            yield from VarStruct._structElements( temp_struct, depth - 1 )
+    def _structLeaves ( members, result ) :
+        for member in members :
+            if type( member.struct ) == list :
+                VarStruct._structLeaves( member.struct, result )
+            elif member.address is not None :
+                result.append( decode_address( member ) )
+        return result
+    def _structElement ( members, leaves, n, index=None ) :
+        # element n of a compact array of structs, leaves iterates the decoded addresses of the first element
+        # together with their strides
+        result = [ ]
+        for member in members :
+            temp = member.copy()
+            if index is not None :
+                temp.index = index
+            if type( member.struct ) == list :
+                temp.struct = VarStruct._structElement( member.struct, leaves, n )
+            elif member.address is not None :
+                leaf, stride = next( leaves )
+                temp.address = encode_address( leaf.type, leaf.index + n * stride, leaf.sub )
+            result.append( temp )
+        return result
+    def _isElement ( members, leaves, n, element, index=None ) :
+        # same as _structElement( members, leaves, n, index ) == element, without building the element
+        if type( element ) != list or len( members ) != len( element ) :
+            return False
+        for member, temp in zip( members, element ) :
+            if type( temp ) != Member or temp.index != index or _member_type( temp ) != _member_type( member ) :
+                return False
+            if type( member.struct ) == list :
+                same = temp.address == member.address and VarStruct._isElement( member.struct, leaves, n, temp.struct )
+            elif member.address is not None :
+                leaf, stride = next( leaves )
+                same = temp.struct == member.struct and \
+                       temp.address == encode_address( leaf.type, leaf.index + n * stride, leaf.sub )
+            else :
+                same = temp.struct == member.struct and temp.address is None
+            if not same :
+                return False
+        return True
+    def iterStructElements ( var ) :
+        # yield the member list of every element of an array of structs, compact or not
+        if var.element is None :
+            yield from VarStruct._structElements( var.struct, len( var.dimension ) )
+            return
+        leaves = VarStruct._structLeaves( var.element, [ ] )
+        for n, index in enumerate( product( *[ range( pair[0], pair[1] + 1 ) for pair in var.dimension ] ) ) :
+            yield VarStruct._structElement( var.element, zip( leaves, var.strides ), n, list( index ) )
+    def iterStructMembers ( var ) :
+        # same as element_iterator( var.struct ), elements of compact arrays are built one at a time
+        if var.element is None :
+            yield from element_iterator( var.struct )
+            return
+        for members in VarStruct.iterStructElements( var ) :
+            yield from members
+    def getStructList ( var ) :
+        # var.struct of a compact array of structs, nested by dimension
+        if var.element is None :
+            return var.struct
+        elements = VarStruct.iterStructElements( var )
+        def nest ( dimension ) :
+            length = dimension[0][1] - dimension[0][0] + 1
+            if len( dimension ) == 1 :
+                return [ next( elements ) for _ in range( length ) ]
+            return [ nest( dimension[1:] ) for _ in range( length ) ]
+        return nest( var.dimension )
+    def compactStructArray ( var ) :
+        if not var.dimension or type( var.struct ) != list :
+            return False
+        elements = list( VarStruct._structElements( var.struct, len( var.dimension ) ) )
+        if len( elements ) < 2 or len( elements ) != _dimension_to_len( var.dimension ) :
+            return False
+        if any( [ type( member ) != Member or member.index is None for member in elements[0] ] ) :
+            return False
+        template = [ member.copy() for member in elements[0] ]
+        for member in template :
+            member.index = None
+        leaves = VarStruct._structLeaves( template, [ ] )
+        next_leaves = VarStruct._structLeaves( elements[1], [ ] )
+        if len( leaves ) != len( next_leaves ) or not all( [ l.code is not None for l in leaves + next_leaves ] ) :
+            return False
+        strides = [ b.index - a.index for a, b in zip( leaves, next_leaves ) ]
+        # every element must be rebuilt exactly as it is, or the array is left as it is
+        indices = product( *[ range( pair[0], pair[1] + 1 ) for pair in var.dimension ] )
+        for n, ( index, element ) in enumerate( zip( indices, elements ) ) :
+            if not VarStruct._isElement( template, zip( leaves, strides ), n, element, list( index ) ) :
+                return False
+        var.struct = None
+        var.element = template
+        var.strides = strides
+        return True
+
+class VarLayout :
+    # size, alignment and member offsets of the structs in the catalog, in bytes as TYPE_SIZE.
+    # Members are aligned on TYPE_ALIGN, arrays and structs on at least STRUCT_ALIGN and the struct size is
+    # rounded up to its alignment. Layouts and leaves are memoized per type name.
+    def __init__ ( self, structs ) :
+        self.structs = structs
+        self.layouts = { }
+        self.leaves = { }
+        self.leaf_sizes = { }
+    def getTypeLayout ( self, vartype, size=1 ) :
+        # ( size of one element, alignment ), None for unknown types
+        if vartype in ( 'string', 'wstring' ) :
+            return size * TYPE_SIZE[ vartype ], TYPE_ALIGN[ vartype ]
+        if vartype in TYPE_SIZE :
+            return TYPE_SIZE[ vartype ], TYPE_ALIGN[ vartype ]
+        layout = self.getLayout( vartype )
+        return ( layout['size'], layout['align'] ) if layout else None
+    def getLayout ( self, typename ) :
+        if typename in self.layouts :
+            return self.layouts[ typename ]
+        if not self.structs.get( typename ) :
+            self.layouts[ typename ] = None
+            return None
+        offset = 0
+        align = STRUCT_ALIGN
+        members = { }
+        for member in self.structs[ typename ].values() :
+            member_layout = self.getTypeLayout( member['type'], member.get( 'size', 1 ) )
+            if member_layout is None :
+                continue
+            stride, member_align = member_layout
+            if member['dimension'] :
+                member_align = max( member_align, STRUCT_ALIGN )
+            offset = -( -offset // member_align ) * member_align
+            members[ member['name'] ] = { 'offset': offset, 'stride': stride }
+            offset += stride * _dimension_to_len( member['dimension'] )
+            align = max( align, member_align )
+        layout = self.layouts[ typename ] = { 'size': int( -( -offset // align ) * align ), 'align': align, 'members': members }
+        return layout
+    def getElementLeaves ( self, vartype, dimension=[], size=1 ) :
+        # [ ( path suffix, type, offset ) ] of every scalar element of an array of vartype
+        type_layout = self.getTypeLayout( vartype, size )
+        if type_layout is None :
+            return [ ]
+        leaves = [ ( '', vartype, 0 ) ] if vartype in TYPE_SIZE else self.getStructLeaves( vartype )
+        if not dimension :
+            return leaves
+        result = [ ]
+        for i, index in enumerate( product( *[ range( pair[0], pair[1] + 1 ) for pair in dimension ] ) ) :
+            prefix = '[{}]'.format( ','.join( [ str(j) for j in index ] ) )
+            offset = i * type_layout[0]
+            result.extend( [ ( prefix + suffix, leaftype, offset + leaf_offset ) for suffix, leaftype, leaf_offset in leaves ] )
+        return result
+    def getStructLeaves ( self, typename ) :
+        if typename in self.leaves :
+            return self.leaves[ typename ]
+        result = [ ]
+        layout = self.getLayout( typename )
+        for name, member_layout in layout['members'].items() :
+            member = self.structs[ typename ][ name ]
+            for suffix, leaftype, offset in self.getElementLeaves( member['type'], member['dimension'], member.get( 'size', 1 ) ) :
+                result.append( ( PATH_JOINER + name + suffix, leaftype, member_layout['offset'] + offset ) )
+        self.leaves[ typename ] = result
+        return result
+    def getLeafSizes ( self, vartype, dimension=[], size=1 ) :
+        # [ size ] in bytes of every leaf of getElementLeaves, in the same order
+        type_layout = self.getTypeLayout( vartype, size )
+        if type_layout is None :
+            return [ ]
+        if vartype in TYPE_SIZE :
+            sizes = [ type_layout[0] ]
+        elif vartype in self.leaf_sizes :
+            sizes = self.leaf_sizes[ vartype ]
+        else :
+            sizes = self.leaf_sizes[ vartype ] = [
+                leaf_size for name in self.getLayout( vartype )['members']
+                for leaf_size in self.getLeafSizes( self.structs[ vartype ][ name ]['type'],
+                                                    self.structs[ vartype ][ name ]['dimension'],
+                                                    self.structs[ vartype ][ name ].get( 'size', 1 ) ) ]
+        return sizes * _dimension_to_len( dimension ) if dimension else sizes
 
 
 def _load_by_nodetag ( filename, node_tag ):
-    temp_tree = None
-    with open( filename, 'r' ) as f :
-        temp_tree = ET.fromstring( ''.join( f.readlines() ) )
-    for element in temp_tree.iter( ) :
-        element_tag = element.tag.split( '}' )
-        element.tag = element_tag[1]
+    # stream the file, strip the namespaces while reading and keep only the first node_tag subtree
     result_tree = None
-    for node in ET.fromstring( ET.tostring( temp_tree ) ).iter( ) :
-        if node.tag == node_tag :
-            result_tree = node
+    depth = 0
+    elements = 0
+    for event, element in ET.iterparse( filename, events=( 'start', 'end' ) ) :
+        if event == 'start' :
+            elements += 1
+            element.tag = element.tag.rsplit( '}', 1 )[-1]
+            if result_tree is None and element.tag == node_tag :
+                result_tree = element
+            if result_tree is not None :
+                depth += 1
+            continue
+        if result_tree is None :
+            # nothing of interest up to here, free the parsed content
+            element.clear()
+            continue
+        depth -= 1
+        if depth == 0 :
             break
+    STATS.count( 'xml_elements', elements )
     return result_tree
 
 # Load XML removing namespaces
 def load_labels ( filename ) :
-    print(filename)
-    return _load_by_nodetag(filename, "configuration")
+    with STATS.stage( 'load' ) :
+        return _load_by_nodetag(filename, "configuration")
 def load_structs ( filename ) :
-    return _load_by_nodetag(filename, "dataTypes")
+    with STATS.stage( 'load' ) :
+        return _load_by_nodetag(filename, "dataTypes")
 
 # 
-def to_dict ( labels_tree, structs_tree, labels_dict={} ) :
-    structs_dict = VarStruct.getAllVarStructs( structs_tree )
+def to_dict ( labels_tree, structs_tree, labels_dict={}, structs_dict=None ) :
+    if structs_dict is None :
+        structs_dict = VarStruct.getStructCatalog( structs_tree )
+    with STATS.stage( 'to_dict' ) :
+        return _to_dict( labels_tree, structs_dict, labels_dict )
+
+def _to_dict ( labels_tree, structs_dict, labels_dict ) :
     for ls in labels_tree :
         # ignore constant variables, they don't have an address
         is_retain = 'retain' in ls.attrib
@@ -342,139 +879,869 @@ def to_dict ( labels_tree, structs_tree, labels_dict={} ) :
                     continue
                 #print ( '{} : not accessible'.format( var.attrib[ 'name' ] ) )
             # get variable type
-            temp_var = { 'name': var.attrib[ 'name' ], 'const': is_const, 'retain': is_retain, 'access': is_access,
-                         **VarType.getVarType(var.find('type'),_initial_value(var),[]) }
-            if 'type' not in temp_var :
+            temp_var = Variable( name=sys.intern( var.attrib[ 'name' ] ), const=is_const, retain=is_retain,
+                                 access=is_access, **VarType.getVarType(var.find('type'),_initial_value(var),[]) )
+            if temp_var.type is None :
                 continue
             # get variable comments
             if ENABLE_COMMENTS :
-                temp_var[ 'comments' ] = [''] * COMMENT_SIZE
+                temp_var.comments = EMPTY_COMMENTS
                 if xml_comments :
-                    temp_var[ 'comments' ] = VarComments.getVarComments( xml_comments, temp_var[ 'comments' ] )
+                    temp_var.comments = VarComments.getVarComments( xml_comments )
             # get variable address
             # get variable inner structure
             if xml_struct is not None :
-                temp_var[ 'struct' ] = VarAddress.getVarAddress( xml_struct )
+                temp_var.struct = VarAddress.getVarAddress( xml_struct )
             else :
-                temp_var[ 'address' ] = var.attrib.get( 'address', '' )
+                temp_var.address = var.attrib.get( 'address', '' )
             # TODO : This must be a function, cause it will be recursive
-            print( "{} : depth : {}".format(temp_var['name'], VarStruct.getVarStructTree( structs_tree, structs_dict, temp_var ) ))
+            VarStruct.getVarStructTree( structs_dict, temp_var )
+            if VarStruct.compactStructArray( temp_var ) :
+                STATS.count( 'compact_arrays' )
             temp_list.append( temp_var )
         if ls.attrib['name'] not in labels_dict:
             labels_dict[ls.attrib['name']] = []
         labels_dict[ls.attrib['name']].extend( temp_list )
+        STATS.count( 'groups' )
+        STATS.count( 'variables', len( temp_list ) )
     return labels_dict
 
 
-def to_list_iter ( in_vars, out_vars, template ) :
-    for var in element_iterator( in_vars ) :
-        row = { **template }
-        if 'index' in var :
-            row[ PLC_TO_GOT_KEYS['name'] ] += ARRAY_JOINER.join( [ str(i) for i in var.get('index',[]) ] ) + NAME_JOINER
-        row[ PLC_TO_GOT_KEYS['name'] ] += var['name']
-        for i,comment in enumerate(var['comments']) :
-            row[ PLC_TO_GOT_KEYS['comments'][i] ] += comment
-        if 'struct' in var :
-            row[ PLC_TO_GOT_KEYS['name'] ] += NAME_JOINER
-            for i,comment in enumerate(var['comments']) :
-                if len(comment) > 0 :
-                    row[ PLC_TO_GOT_KEYS['comments'][i] ] += COMMENT_JOINER
-            to_list_iter ( var['struct'], out_vars, row )
-        else :
-            row[ PLC_TO_GOT_KEYS['type'] ] = PLC_TO_GOT_TYPES[ var['type'] ]
-            temp_dimension = var['dimension']
-            if var['type'] == 'string' :
-                temp_dimension.append([0,var['size']/2-1])
-            elif var['type'] == 'wstring' :
-                temp_dimension.append([0,var['size']-1])
-            if len(temp_dimension) > 0 :
-                row[ PLC_TO_GOT_KEYS['type'] ] += '[{0}]'.format(
-                    ','.join([ '{0}..{1}'.format(*pair) for pair in temp_dimension ]) )
-            row[ PLC_TO_GOT_KEYS['address'] ] = var['address']
-            out_vars.append( row )
+def list_label_files ( folder ) :
+    # sorted, so the label groups are always merged in the same order
+    return [ join( folder, filename ) for filename in sorted( listdir( folder ) )
+             if filename.endswith( '.xml' ) and filename != STRUCTS_FILE ]
+
+_worker_structs = None
+
+def _to_dict_init ( structs_dict, stats=False ) :
+    global _worker_structs
+    _worker_structs = structs_dict
+    STATS.enabled = stats
+
+def _to_dict_file ( filename ) :
+    start = perf_counter()
+    result = to_dict( load_labels( filename ), None, {}, _worker_structs )
+    return result, perf_counter() - start
+
+def _to_dict_worker ( filename ) :
+    # stats of worker processes are sent back with the result and merged
+    STATS.reset()
+    return ( *_to_dict_file( filename ), STATS.snapshot() )
+
+def _file_digest ( filename, salt='' ) :
+    digest = hashlib.sha256( salt.encode() )
+    with open( filename, 'rb' ) as f :
+        for chunk in iter( lambda: f.read( 1 << 20 ), b'' ) :
+            digest.update( chunk )
+    return digest.hexdigest()
+
+
+class LabelCache :
+    # on disk cache of the to_dict result of each label file, keyed by the content hash of the file.
+    # entries live in a folder named after the hash of the struct file, so a changed struct file misses. Old
+    # folders are left to evict, which only removes entries of struct hash folders in the cache subfolder
+    def __init__ ( self, folder, structs_file, max_size=CACHE_SIZE ) :
+        salt = '{}:{}:{}'.format( CACHE_VERSION, IS_TEST, ENABLE_COMMENTS )
+        self.max_size = max_size
+        self.root = join( folder, CACHE_NAME )
+        self.folder = join( self.root, _file_digest( structs_file, salt ) )
+        makedirs( self.folder, exist_ok=True )
+        if not isfile( join( self.root, CACHE_MARKER ) ) :
+            with open( join( self.root, CACHE_MARKER ), 'w' ) as f :
+                f.write( CACHE_TAG )
+    def key ( self, filename ) :
+        return join( self.folder, _file_digest( filename ) + '.json' )
+    def get ( self, key ) :
+        try :
+            with open( key, 'r' ) as f :
+                result = json.load( f )
+        except ( OSError, ValueError ) :
+            return None
+        # refresh the entry, eviction drops the least recently used first
+        utime( key )
+        return to_records( result )
+    def put ( self, key, labels_dict ) :
+        # the folder may have been evicted by another build sharing the cache
+        makedirs( self.folder, exist_ok=True )
+        with open( key + '.tmp', 'w' ) as f :
+            json.dump( labels_dict, f, separators=(',',':'), default=_json_record )
+        replace( key + '.tmp', key )
+    def evict ( self ) :
+        # least recently used entries of every struct hash folder first, until the cache fits in max_size
+        entries = [ ]
+        folders = [ join( self.root, name ) for name in listdir( self.root ) if CACHE_DIGEST.fullmatch( name ) ]
+        for folder in folders :
+            for name in listdir( folder ) if isdir( folder ) else [ ] :
+                try :
+                    info = stat( join( folder, name ) )
+                except OSError :
+                    continue
+                entries.append( ( info.st_mtime, info.st_size, join( folder, name ) ) )
+        total = sum( entry[1] for entry in entries )
+        for mtime, size, path in sorted( entries ) :
+            if total <= self.max_size :
+                break
+            try :
+                remove( path )
+            except OSError :
+                pass
+            total -= size
+        # empty folders of other struct files, a build still writing in one keeps it
+        for folder in folders :
+            if folder != self.folder :
+                try :
+                    rmdir( folder )
+                except OSError :
+                    pass
+
+
+def to_dict_files ( filenames, structs_dict, labels_dict=None, workers=1, cache=None ) :
+    # convert each label file on its own, in worker processes if requested, then merge them in order
+    if labels_dict is None :
+        labels_dict = { }
+    results = [ None ] * len( filenames )
+    if cache is not None :
+        keys = [ cache.key( filename ) for filename in filenames ]
+        results = [ cache.get( key ) for key in keys ]
+    missing = [ i for i, result in enumerate( results ) if result is None ]
+    STATS.count( 'cache_hits', len( filenames ) - len( missing ) )
+    STATS.count( 'cache_misses', len( missing ) )
+    if workers > 1 and len( missing ) > 1 :
+        with ProcessPoolExecutor( max_workers=workers, initializer=_to_dict_init,
+                                  initargs=(structs_dict,STATS.enabled) ) as pool :
+            converted = [ ]
+            for result, seconds, snapshot in pool.map( _to_dict_worker, [ filenames[i] for i in missing ] ) :
+                STATS.merge( snapshot )
+                converted.append( ( result, seconds ) )
+    else :
+        _to_dict_init( structs_dict, STATS.enabled )
+        converted = map( _to_dict_file, [ filenames[i] for i in missing ] )
+    for i, ( result, seconds ) in zip( missing, converted ) :
+        STATS.file( filenames[i], seconds )
+        results[i] = result
+        if cache is not None :
+            cache.put( keys[i], result )
+    if cache is not None :
+        cache.evict()
+    for result in results :
+        for k, l in result.items() :
+            if k not in labels_dict :
+                labels_dict[k] = []
+            labels_dict[k].extend( l )
+    return labels_dict
+
+
+def iter_rows ( in_vars, name='', comments=( '', ) * COMMENT_SIZE ) :
+    # yield the GOT rows of the variables in CSV_KEYS order, names and comments of the structs are prefixed
+    for var in in_vars :
+        temp_name = name
+        if var.index is not None :
+            temp_name += ARRAY_JOINER.join( [ str(i) for i in var.index ] ) + NAME_JOINER
+        temp_name += var.name
+        var_comments = var.comments
+        temp_comments = tuple( [ c + v for c, v in zip( comments, var_comments ) ] ) if var_comments else comments
+        if var.struct is not None or var.element is not None :
+            if var_comments :
+                temp_comments = tuple( [ c + COMMENT_JOINER if len( v ) > 0 else c
+                                         for c, v in zip( temp_comments, var_comments ) ] )
+            yield from iter_rows( VarStruct.iterStructMembers( var ), temp_name + NAME_JOINER, temp_comments )
+        elif var.type in PLC_TO_GOT_TYPES :
+            temp_type = PLC_TO_GOT_TYPES[ var.type ]
+            temp_dimension = var.dimension
+            if var.type == 'string' :
+                temp_dimension = temp_dimension + [ [ 0, var.size // 2 - 1 ] ]
+            elif var.type == 'wstring' :
+                temp_dimension = temp_dimension + [ [ 0, var.size - 1 ] ]
+            if len( temp_dimension ) > 0 :
+                temp_type += '[{0}]'.format( ','.join( [ '{0}..{1}'.format( *pair ) for pair in temp_dimension ] ) )
+            yield [ temp_name, temp_type, var.address, *temp_comments ]
 
 
 def to_list ( labels_dict ) :
     labels_result = { }
     for k, l in labels_dict.items() :
-        labels_list = [ ]
-        template = { PLC_TO_GOT_KEYS['name'] : '' }
-        for key in PLC_TO_GOT_KEYS['comments'] :
-            template[ key ] = ''
-        to_list_iter ( l, labels_list, template )
-        labels_result[k] = labels_list
+        labels_result[k] = [ dict( zip( CSV_KEYS, row ) ) for row in iter_rows( l ) ]
     return labels_result
 
 
-def to_csv ( index, name, labels_list ) :
-    with open ( name + '.csv', 'w', newline='' ) as output_file:
+def write_csv ( index, name, rows, folder='' ) :
+    # rows are lists in CSV_KEYS order, like the ones of iter_rows
+    with open ( join( folder, name + '.csv' ), 'w', newline='' ) as output_file:
         output_file.write( '{0},{1}\n,"{2}"\n\n'.format( index, name, '' ) )
         output_file.write( ',"{}"\n'.format( '","'.join(CSV_KEYS) ) )
-        for label in labels_list :
-            output_file.write( ',"{}"\n'.format( '","'.join( [ label[key] for key in CSV_KEYS ] ) ) )
+        for row in rows :
+            output_file.write( ',"{}"\n'.format( '","'.join( row ) ) )
+
+def to_csv ( index, name, labels_list ) :
+    write_csv( index, name, ( [ label[key] for key in CSV_KEYS ] for label in labels_list ) )
+
+def to_csv_files ( labels_dict, folder='', workers=4 ) :
+    # one GOT csv file per label group, written concurrently and streamed from the label tree
+    with ThreadPoolExecutor( max_workers=workers ) as pool :
+        futures = [ pool.submit( write_csv, i+1, k, iter_rows( l ), folder ) for i, ( k, l ) in enumerate( labels_dict.items() ) ]
+        for future in futures :
+            future.result()
 
 
+class AddressError ( ValueError ) :
+    # device address that can't be decoded, reason is one of ADDRESS_ERRORS
+    def __init__ ( self, address, reason, path=None ) :
+        super().__init__( '{} : {}'.format( address if path is None else '{} : {}'.format( path, address ), reason ) )
+        self.address = address
+        self.reason = reason
+        self.path = path
+
+def _address_fields ( address ) :
+    # ( source, type, code, sub, index, size ) of a device address, the fields of Address, raises AddressError
+    match = ADDRESS_PATTERN.fullmatch( address )
+    if match is None :
+        raise AddressError( address, ADDRESS_ERRORS[ ADDRESS_NO_INDEX ] )
+    dev_type, dev_addr, dev_sub = match.groups()
+    device = SLMP_COMPATIBLE_DEVICES.get( dev_type )
+    if device is None :
+        raise AddressError( address, ADDRESS_ERRORS[ ADDRESS_DEVICE ] )
+    if len( dev_addr ) > ADDRESS_DIGITS or dev_addr.strip( DECIMAL_DIGITS if device['base'] == 10 else HEX_DIGITS ) :
+        raise AddressError( address, ADDRESS_ERRORS[ ADDRESS_INDEX ] )
+    sub = None
+    if dev_sub is not None :
+        if device['size'] < 1 or not 0 < len( dev_sub ) <= 2 or dev_sub.strip( HEX_DIGITS ) \
+                or int( dev_sub, 16 ) >= device['size'] * 8 :
+            raise AddressError( address, ADDRESS_ERRORS[ ADDRESS_SUB ] )
+        sub = int( dev_sub, 16 )
+    return address, DEVICE_NAMES[ dev_type ], device['code'], sub, int( dev_addr, device['base'] ), device['size']
+
+def parse_address ( address ) :
+    # decoded address of a device like 'D100', 'X1F' or 'W1A.3', raises AddressError
+    return Address( *_address_fields( address ) )
+
 def decode_address ( var ) :
-    result = { 'source': var['address'] }
+    # decoded address of var['address'], only its source if it can't be decoded
     try :
-        for i, c in enumerate( var['address'] ) :
-            if c.isnumeric() :
-                dev_type = var['address'][:i]
-                if dev_type not in SLMP_COMPATIBLE_DEVICES :
-                    #print('not supported device type')
-                    break
-                result['type'] = dev_type
-                result['code'] = SLMP_COMPATIBLE_DEVICES[dev_type]['code']
-                dev_addr = var['address'][i:]
-                if '.' in dev_addr :
-                    dev_addr, dev_sub = dev_addr.split('.')
-                    result['sub'] = int(dev_sub,16)
-                result['index'] = int(dev_addr,SLMP_COMPATIBLE_DEVICES[dev_type]['base'])
-                result['size'] = SLMP_COMPATIBLE_DEVICES[dev_type]['size']
-                break
-    except BaseException as ex :
-        print(ex)
-        print(var['address'])
+        return parse_address( var['address'] )
+    except AddressError :
+        return Address( var['address'] )
+
+def encode_address ( dev_type, index, sub=None ) :
+    result = dev_type + format( index, 'X' if SLMP_COMPATIBLE_DEVICES[dev_type]['base'] == 16 else 'd' )
+    if sub is not None :
+        result += '.{:X}'.format( sub )
     return result
 
-def decode_type ( var ) :
-    # TODO : By exporting the labels i should also get the offset of the datatype, here i should use that as "type.size"
-    return { 'source': var['type'], 'size': TYPE_SIZE.get(var['type'],-1) }
+def offset_address ( address, offset, bit=False ) :
+    # decoded address of the device offset bytes after address, bits of word devices get a sub index
+    device = SLMP_COMPATIBLE_DEVICES[ address['type'] ]
+    result = Address( type=address['type'], code=address['code'], size=address['size'] )
+    if device['size'] < 1 :
+        result.index = address['index'] + int( offset * 8 )
+    else :
+        bits = address.get( 'sub', 0 ) + int( offset * 8 )
+        result.index = address['index'] + bits // int( device['size'] * 8 )
+        if bit or 'sub' in address or bits % int( device['size'] * 8 ) :
+            result.sub = bits % int( device['size'] * 8 )
+    result.source = encode_address( address['type'], result.index, result.sub )
+    return result
+
+# Compiled address decoder, whole lists of addresses are decoded at once into ADDRESS_DTYPE arrays. The strings
+# are laid out as a matrix of characters and parsed column by column with lookup tables : device prefix up to
+# the first decimal digit, index in the base of the device, bit index after the dot.
+def _address_tables ( ) :
+    digits = NP.full( 128, 16, NP.uint8 )  # value of each character, 16 if not an hex digit
+    for i, c in enumerate( '0123456789ABCDEF' ) :
+        digits[ ord( c ) ] = digits[ ord( c.lower() ) ] = i
+    prefixes = sorted( [ ( _prefix_key( name ), device ) for name, device in SLMP_COMPATIBLE_DEVICES.items() ] )
+    devices = NP.array( [ ( key, device['code'], device['base'], device['size'] * 8 ) for key, device in prefixes ],
+                        dtype=[ ( 'key', 'u8' ), ( 'code', 'u1' ), ( 'base', 'u1' ), ( 'unit', 'u1' ) ] )
+    return digits, devices
+
+def _prefix_key ( name ) :
+    return int.from_bytes( name.encode( 'ascii' ).rjust( ADDRESS_PREFIX, b'\0' ), 'big' )
+
+ADDRESS_TABLES = _address_tables()
+
+def decode_addresses ( addresses ) :
+    # decode_address of a list of addresses, as an ADDRESS_DTYPE array. Addresses that can't be decoded have
+    # their ADDRESS_ERRORS id in 'error', see address_errors
+    chars = NP.array( addresses, dtype=str )
+    count = len( chars )
+    width = chars.dtype.itemsize // 4
+    result = NP.zeros( count, ADDRESS_DTYPE )
+    result['sub'] = -1
+    if width == 0 :
+        result['error'] = ADDRESS_NO_INDEX
+        return result
+    # characters out of ascii are never valid, as DEL
+    chars = NP.minimum( chars.view( NP.uint32 ).reshape( count, width ), 127 ).astype( NP.uint8 )
+    values = ADDRESS_TABLES[0][ chars ]
+    rows = NP.arange( count )
+    length = ( chars != 0 ).sum( axis=1, dtype=NP.int16 )
+    digits = values < 10
+    start = NP.argmax( digits, axis=1 ).astype( NP.int16 )
+    found = digits.any( axis=1 )
+    dots = chars == ord( '.' )
+    has_sub = dots.any( axis=1 )
+    end = NP.where( has_sub, NP.argmax( dots, axis=1 ), length ).astype( NP.int16 )
+    # device prefix, packed in an integer like _prefix_key and looked up in the sorted device table
+    key = NP.zeros( count, NP.uint64 )
+    for j in range( ADDRESS_PREFIX ) :
+        column = chars[ :, j ] if j < width else 0
+        key = ( key << NP.uint64( 8 ) ) | NP.where( j < start, column, 0 ).astype( NP.uint64 )
+    key >>= ( 8 * ( ADDRESS_PREFIX - NP.minimum( start, ADDRESS_PREFIX ) ) ).astype( NP.uint64 )
+    devices = ADDRESS_TABLES[1]
+    device = NP.minimum( NP.searchsorted( devices['key'], key ), len( devices ) - 1 )
+    known = found & ( start <= ADDRESS_PREFIX ) & ( devices['key'][ device ] == key )
+    base = devices['base'][ device ]
+    unit = devices['unit'][ device ]
+    # index, one column at a time, columns out of the index multiply by 1 and add 0
+    columns = NP.arange( width, dtype=NP.int16 )[ :, None ]
+    values_t = NP.ascontiguousarray( values.T )
+    in_index = ( columns >= start ) & ( columns < end )
+    bad_index = ( ( end - start ) > ADDRESS_DIGITS ) | ( in_index & ( values_t >= base ) ).any( axis=0 )
+    factors = NP.where( in_index, base, NP.uint8( 1 ) )
+    values_t *= in_index
+    index = NP.zeros( count, NP.int64 )
+    for j in range( width ) :
+        index *= factors[j]
+        index += values_t[j]
+    # bit index, one or two hex digits after the dot
+    sub_length = length - end - 1
+    high = values[ rows, NP.minimum( end + 1, width - 1 ) ].astype( NP.int64 )
+    low = values[ rows, NP.minimum( end + 2, width - 1 ) ]
+    sub = NP.where( sub_length == 2, high * 16 + low, high )
+    bad_sub = ( sub_length < 1 ) | ( sub_length > 2 ) | ( high >= 16 ) | ( ( sub_length == 2 ) & ( low >= 16 ) )
+    bad_sub = has_sub & ( bad_sub | ( unit < 8 ) | ( sub >= unit ) )
+    error = NP.where( bad_sub, NP.uint8( ADDRESS_SUB ), NP.uint8( ADDRESS_OK ) )
+    error[ bad_index ] = ADDRESS_INDEX
+    error[ ~known ] = ADDRESS_DEVICE
+    error[ ~found ] = ADDRESS_NO_INDEX
+    ok = error == ADDRESS_OK
+    result['error'] = error
+    result['code'] = NP.where( ok, devices['code'][ device ], 0 )
+    result['unit'] = NP.where( ok, unit, 0 )
+    result['index'] = NP.where( ok, index, 0 )
+    result['sub'] = NP.where( ok & has_sub, sub, -1 )
+    return result
+
+def address_errors ( addresses, decoded, paths=None ) :
+    # AddressError of every address of decode_addresses that couldn't be decoded
+    return [ AddressError( addresses[i], ADDRESS_ERRORS[ decoded['error'][i] ], None if paths is None else paths[i] )
+             for i in NP.flatnonzero( decoded['error'] ) ]
+
+def encode_addresses ( decoded ) :
+    # encode_address of every row of an ADDRESS_DTYPE array, None where it couldn't be decoded
+    return [ encode_address( DEVICE_TYPES[ code ], index, sub if sub >= 0 else None ) if not error else None
+             for code, index, sub, error in zip( decoded['code'].tolist(), decoded['index'].tolist(),
+                                                 decoded['sub'].tolist(), decoded['error'].tolist() ) ]
+
+def offset_addresses ( decoded, offsets, bit=False ) :
+    # offset_address of every row of an ADDRESS_DTYPE array, offsets in bytes as TYPE_SIZE, bits are 0.125.
+    # Bit devices move by bits, word and dword devices by their unit with the remainder in the bit index
+    offsets = NP.broadcast_to( offsets, decoded.shape )
+    result = decoded.copy()
+    bits = NP.rint( offsets * 8 ).astype( NP.int64 )
+    unit = NP.maximum( decoded['unit'], 1 ).astype( NP.int64 )
+    has_sub = decoded['sub'] >= 0
+    bits += NP.where( has_sub, decoded['sub'], 0 )
+    result['index'] = decoded['index'] + bits // unit
+    keep = ( unit > 1 ) & ( bit | has_sub | ( bits % unit != 0 ) )
+    result['sub'] = NP.where( keep, bits % unit, -1 )
+    error = decoded['error'] != ADDRESS_OK
+    result['index'][ error ] = decoded['index'][ error ]
+    result['sub'][ error ] = decoded['sub'][ error ]
+    return result
+
+def element_positions ( dimension, elements ) :
+    # flat row major position of the elements [ i, j, k ] of an array of dimension, -1 out of its bounds
+    elements = NP.asarray( elements, dtype=NP.int64 ).reshape( -1, len( dimension ) )
+    low = NP.array( [ pair[0] for pair in dimension ], dtype=NP.int64 )
+    high = NP.array( [ pair[1] for pair in dimension ], dtype=NP.int64 )
+    strides = NP.cumprod( ( high - low + 1 )[::-1] )[::-1]
+    strides = NP.append( strides[1:], 1 )
+    inside = ( ( elements >= low ) & ( elements <= high ) ).all( axis=1 )
+    return NP.where( inside, ( ( elements - low ) * strides ).sum( axis=1 ), -1 )
+
+def element_addresses ( var, elements, layout=None ) :
+    # decoded addresses of the elements [ i, j, k ] of an array label, as an ADDRESS_DTYPE array. Elements of
+    # arrays of structs need the layout of the struct, out of bounds elements are ADDRESS_ELEMENT errors
+    type_layout = ( layout or VarLayout( { } ) ).getTypeLayout( var['type'], var.get( 'size', 1 ) )
+    if type_layout is None :
+        raise AddressError( var['address'], 'unknown type {}'.format( var['type'] ) )
+    positions = element_positions( var['dimension'], elements )
+    decoded = decode_addresses( [ var['address'] ] * len( positions ) )
+    result = offset_addresses( decoded, positions * type_layout[0], var['type'] == 'BOOL' )
+    result['error'][ ( positions < 0 ) & ( result['error'] == ADDRESS_OK ) ] = ADDRESS_ELEMENT
+    return result
+
+def _type_size ( vartype, layout=None ) :
+    if layout is not None and vartype not in TYPE_SIZE :
+        struct_layout = layout.getLayout( vartype )
+        return struct_layout['size'] if struct_layout else -1
+    return TYPE_SIZE.get(vartype,-1)
+
+def decode_type ( var, layout=None ) :
+    return TypeInfo( var['type'], _type_size( var['type'], layout ) )
 
-def to_json_iter ( in_vars, out_vars ) :
+def _json_address ( address ) :
+    # decode_address( ... ).asdict() without the record, only the source if it can't be decoded
+    try :
+        fields = _address_fields( address )
+    except AddressError :
+        return { 'source': address }
+    source, dev_type, code, sub, index, size = fields
+    if sub is None :
+        return { 'source': source, 'type': dev_type, 'code': code, 'index': index, 'size': size }
+    return { 'source': source, 'type': dev_type, 'code': code, 'sub': sub, 'index': index, 'size': size }
+
+def _json_element ( members, leaves, n, index=None ) :
+    # to_json_iter of VarStruct._structElement( ... ), built from the json of the first element: the addresses of
+    # the leaves are decoded once and moved by their strides, nothing is encoded to be decoded again
+    result = [ ]
+    for member in members :
+        temp = { 'index': index, **member } if index is not None else { **member }
+        if type( member.get( 'struct' ) ) == list :
+            temp['struct'] = _json_element( member['struct'], leaves, n )
+        elif 'address' in member :
+            leaf, stride = next( leaves )
+            address = { 'source': encode_address( leaf.type, leaf.index + n * stride, leaf.sub ), 'type': leaf.type,
+                        'code': leaf.code, 'sub': leaf.sub, 'index': leaf.index + n * stride, 'size': leaf.size }
+            if leaf.sub is None :
+                del address['sub']
+            temp['address'] = address
+        result.append( temp )
+    return result
+
+def _json_struct_list ( var, layout=None ) :
+    # to_json_iter of VarStruct.getStructList( var ) for a compact array of structs, nested by dimension
+    template = [ ]
+    to_json_iter( var.element, template, layout )
+    leaves = VarStruct._structLeaves( var.element, [ ] )
+    elements = iter( [ _json_element( template, zip( leaves, var.strides ), n, list( index ) ) for n, index in
+                       enumerate( product( *[ range( pair[0], pair[1] + 1 ) for pair in var.dimension ] ) ) ] )
+    def nest ( dimension ) :
+        length = dimension[0][1] - dimension[0][0] + 1
+        if len( dimension ) == 1 :
+            return [ next( elements ) for _ in range( length ) ]
+        return [ nest( dimension[1:] ) for _ in range( length ) ]
+    return nest( var.dimension )
+
+def to_json_var ( var, layout=None, compact=False ) :
+    # the plain dict of a record, addresses and types decoded. The fields are copied once and replaced in place,
+    # the decoded addresses and types are built as dicts directly.
+    # compact arrays of structs are written as 'element' and 'strides' if compact, else rebuilt as 'struct'
+    temp = var.asdict()
+    if var.address is not None :
+        temp['address'] = _json_address( var.address )
+    if var.element is not None and not compact :
+        temp = { ( 'struct' if k == 'element' else k ): v for k, v in temp.items() if k != 'strides' }
+        temp['struct'] = _json_struct_list( var, layout )
+    else :
+        for k in ( 'struct', 'element' ) :
+            if k in temp :
+                temp_struct = [ ]
+                to_json_iter( temp[k], temp_struct, layout, compact )
+                temp[k] = temp_struct
+    if var.type is not None :
+        temp['type'] = { 'source': var.type, 'size': _type_size( var.type, layout ) }
+    return temp
+
+def to_json_iter ( in_vars, out_vars, layout=None, compact=False ) :
     for var in in_vars :
         if type( var ) == list :
             temp_list = [ ]
-            to_json_iter( var, temp_list )
+            to_json_iter( var, temp_list, layout, compact )
             out_vars.append( temp_list )
         else:
-            temp = { **var }
-            if 'address' in var :
-                temp['address'] = decode_address( var )
-            if 'struct' in var :
-                temp_struct = [ ]
-                to_json_iter ( var['struct'], temp_struct )
-                temp['struct'] = temp_struct
-            if 'type' in var :
-                temp['type'] = decode_type( var )
-            out_vars.append( temp )
+            out_vars.append( to_json_var( var, layout, compact ) )
 
 
-def to_json ( labels_dict ) :
+def to_json ( labels_dict, layout=None, compact=False ) :
     dict_result = { }
-    for k, l in labels_dict.items() :
-        print(k)
-        temp_list = [ ]
-        to_json_iter( l, temp_list )
-        dict_result[k] = temp_list
+    with STATS.stage( 'decode' ) :
+        for k, l in labels_dict.items() :
+            temp_list = [ ]
+            to_json_iter( l, temp_list, layout, compact )
+            dict_result[k] = temp_list
     return dict_result
 
 
-def test ( ) :
-    test = load('cmc_ws/xml/testl.xml','cmc_ws/xml/tests.xml')
-    labs,strs = to_dict(*test)
-    res = to_list( labs )
-    to_csv( 1, 'TestLabel',res['TestLabel'])
+def dump_json ( labels_dict, output_file, indent=None, layout=None, compact=False ) :
+    # same output as json.dump( to_json( labels_dict ), output_file, indent=indent ), compact if indent is None,
+    # but each variable is decoded and written on its own, the whole result is never held in memory
+    if indent is None :
+        separators, newline, step = (',',':'), '', ''
+    else :
+        separators, newline, step = (',',': '), '\n', ' ' * indent
+    start = perf_counter()
+    decode = 0
+    output_file.write( '{' )
+    for i, ( k, l ) in enumerate( labels_dict.items() ) :
+        output_file.write( '{}{}{}{}['.format( ',' if i else '', newline + step, json.dumps( k ), separators[1] ) )
+        for j, var in enumerate( l ) :
+            decode_start = perf_counter()
+            temp = to_json_var( var, layout, compact )
+            decode += perf_counter() - decode_start
+            text = json.dumps( temp, indent=indent, separators=separators )
+            if indent is not None :
+                text = text.replace( '\n', '\n' + step * 2 )
+            output_file.write( '{}{}{}'.format( ',' if j else '', newline + step * 2, text ) )
+        output_file.write( '{}]'.format( newline + step if len( l ) else '' ) )
+    output_file.write( '{}}}'.format( newline if len( labels_dict ) else '' ) )
+    STATS.add( 'decode', decode )
+    STATS.add( 'serialize', perf_counter() - start - decode )
+
+
+def _iter_leaves ( var, path ) :
+    if type( var.struct ) == list or var.element is not None :
+        for temp_var in VarStruct.iterStructMembers( var ) :
+            temp_path = path
+            if temp_var.index is not None :
+                temp_path += '[{}]'.format( ','.join( [ str(i) for i in temp_var.index ] ) )
+            yield from _iter_leaves( temp_var, temp_path + PATH_JOINER + temp_var.name )
+    elif var.address is not None and var.type is not None :
+        yield path, var
+
+def iter_leaves ( labels_dict ) :
+    # yield ( path, var ) for every variable with its own address, like Group.Var[1,2].Member
+    for k, l in labels_dict.items() :
+        for var in l :
+            yield from _iter_leaves( var, k + PATH_JOINER + var.name )
+
+def expand_leaves ( labels_dict, layout ) :
+    # yield ( path, type, decoded address ) for every scalar element of every label with an address,
+    # arrays and structs are expanded with the struct layouts
+    for path, var in iter_leaves( labels_dict ) :
+        address = decode_address( var )
+        if address.code is None :
+            continue
+        for suffix, leaftype, offset in layout.getElementLeaves( var.type, var.dimension, var.get( 'size', 1 ) ) :
+            yield path + suffix, leaftype, offset_address( address, offset, leaftype == 'BOOL' )
+
+def _byte_size ( var ) :
+    # strings are sized per element, everything else per array
+    size = var.size * TYPE_SIZE[ var.type ]
+    if var.type in ( 'string', 'wstring' ) :
+        size *= _dimension_to_len( var.dimension )
+    return size
+
+
+def to_table ( labels_dict, layout, errors=None ) :
+    # one row per addressable leaf, names are stored in a separate utf-8 table. Labels of struct types are
+    # expanded with the layout into one row per scalar element, as expand_leaves. The addresses are decoded at
+    # once, labels with an address that can't be decoded are skipped and their AddressError appended to errors
+    labels = [ ]
+    for path, var in iter_leaves( labels_dict ) :
+        vartype = decode_type( var ).source
+        if vartype in TYPE_IDS :
+            labels.append( ( path, var, [ ( '', vartype, 0, _byte_size( var ), var.dimension ) ] ) )
+        else :
+            size = var.get( 'size', 1 )
+            leaves = zip( layout.getElementLeaves( vartype, var.dimension, size ),
+                          layout.getLeafSizes( vartype, var.dimension, size ) )
+            labels.append( ( path, var, [ ( suffix, leaftype, offset, leaf_size, [ ] )
+                                          for ( suffix, leaftype, offset ), leaf_size in leaves ] ) )
+    addresses = [ var.address for _, var, _ in labels ]
+    decoded = decode_addresses( addresses )
+    if errors is not None :
+        errors.extend( address_errors( addresses, decoded, [ path for path, _, _ in labels ] ) )
+    rows = [ ]
+    label_rows = [ ]
+    offsets = [ ]
+    bits = [ ]
+    names = bytearray()
+    for i in NP.flatnonzero( decoded['error'] == ADDRESS_OK ).tolist() :
+        path, var, leaves = labels[i]
+        for suffix, leaftype, offset, leaf_size, dimension in leaves :
+            name = ( path + suffix ).encode( 'utf-8' )
+            rows.append( ( 0, 0, 0, leaf_size, TYPE_IDS[ leaftype ], len( dimension ),
+                           ( dimension + [ [0,-1] ] * 3 )[:3], len( names ), len( name ) ) )
+            names += name
+            label_rows.append( i )
+            offsets.append( offset )
+            bits.append( leaftype == 'BOOL' and suffix != '' )
+    table = NP.array( rows, dtype=LABEL_DTYPE )
+    # addresses of the struct leaves as offset_address in expand_leaves, other labels are their own leaf at offset 0
+    leaf_addresses = offset_addresses( decoded[ NP.array( label_rows, dtype=NP.intp ) ],
+                                       NP.array( offsets, dtype=float ), NP.array( bits, dtype=bool ) )
+    for field in ( 'code', 'index', 'sub' ) :
+        table[ field ] = leaf_addresses[ field ]
+    return table, NP.frombuffer( bytes( names ), dtype=NP.uint8 )
+
+
+def to_npy ( filename, table, names ) :
+    NP.save( filename + '.npy', table )
+    NP.save( filename + '_names.npy', names )
+
+def load_npy ( filename ) :
+    return NP.load( filename + '.npy', mmap_mode='r' ), NP.load( filename + '_names.npy', mmap_mode='r' )
+
+def table_name ( names, row ) :
+    return bytes( names[ row['name'] : row['name'] + row['length'] ] ).decode( 'utf-8' )
+
+
+
+def _plan_ranges ( table, names, write ) :
+    # ( code, start, count, name ) in device points for every row of the table, bit devices counted in bits
+    ranges = { }
+    skipped = [ ]
+    for row in table[ NP.lexsort( ( table['index'], table['code'] ) ) ] :
+        unit = SLMP_COMPATIBLE_DEVICES[ DEVICE_TYPES[ int(row['code']) ] ]['size']
+        if row['sub'] >= 0 :
+            # bits of a word device are read in the words they span, but writing them would overwrite the other
+            # bits of the words unless they cover whole words
+            bits = int( row['sub'] ) + int( row['size'] * 8 )
+            if write and ( row['sub'] or bits % int( unit * 8 ) ) :
+                skipped.append( table_name( names, row ) )
+                continue
+            count = -( -bits // int( unit * 8 ) )
+        else :
+            count = max( 1, int( -( -row['size'] // unit ) ) )
+        ranges.setdefault( int(row['code']), [ ] ).append( ( int(row['index']), count, table_name( names, row ) ) )
+    return ranges, skipped
+
+def _plan_blocks ( ranges, gap, limit ) :
+    # merge ranges closer than gap, then split the merged blocks at limit
+    blocks = [ ]
+    for start, count, name in ranges :
+        if blocks and start - blocks[-1][1] <= gap :
+            blocks[-1][1] = max( blocks[-1][1], start + count )
+            blocks[-1][2].append( ( start, count, name ) )
+        else :
+            blocks.append( [ start, start + count, [ ( start, count, name ) ] ] )
+    for start, end, labels in blocks :
+        # each label goes in the chunks it overlaps, from its first to its last one
+        chunks = [ [ ] for _ in range( start, end, limit ) ]
+        for s, c, name in labels :
+            for i in range( max( 0, ( s - start ) // limit ), ( s + c - 1 - start ) // limit + 1 ) :
+                chunks[i].append( ( name, s - start - i * limit, c ) )
+        for i, head in enumerate( range( start, end, limit ) ) :
+            yield head, min( end, head + limit ) - head, chunks[i]
+
+def _plan_frames ( items, count_limit, size_limit ) :
+    # pack ( item, size ) in order, a new frame is started when either limit would be exceeded
+    frames = [ ]
+    for item, item_size in items :
+        if not frames or len( frames[-1][0] ) >= count_limit or frames[-1][1] + item_size > size_limit :
+            frames.append( [ [ ], 0 ] )
+        frames[-1][0].append( item )
+        frames[-1][1] += item_size
+    return [ frame[0] for frame in frames ]
+
+def compile_plan ( table, names, gap=PLAN_GAP, write=False ) :
+    # group the leaves by device, merge ranges that are at most gap words apart (never for writes, that would
+    # overwrite the devices in between) and split them at the SLMP frame limits. Each block then goes either
+    # in a block access or, if cheaper, in a random access of its labels, as words and dwords.
+    # Bit devices are accessed in words of 16 bits, for writes they are written bit by bit instead.
+    ranges, skipped = _plan_ranges( table, names, write )
+    blocks = [ ]
+    random = { 'words': [ ], 'dwords': [ ], 'bits': [ ] }
+    for code, code_ranges in ranges.items() :
+        device = DEVICE_TYPES[ code ]
+        unit = SLMP_COMPATIBLE_DEVICES[ device ]['size']
+        if unit < 1 and write :
+            for start, count, name in code_ranges :
+                for i in range( count ) :
+                    random['bits'].append( { 'device': device, 'code': code, 'index': start + i,
+                                             'label': name, 'offset': i } )
+            continue
+        # points per word, words per point
+        ppw = 16 if unit < 1 else 1
+        wpp = max( 1, int( unit ) // 2 )
+        limit = SLMP_SIZE['BATCH'] * ppw // wpp
+        for head, points, labels in _plan_blocks( code_ranges, 0 if write else gap * ppw // wpp, limit ) :
+            words = -( -points // ppw ) * wpp
+            block_cost = SLMP_COST['DEVICE'] + SLMP_COST['POINTS'] + words * 2 + \
+                         SLMP_COST['FRAME'] * max( 1 / SLMP_SIZE['BLOCK'], words / SLMP_SIZE['BATCH'] )
+            random_points = [ ]
+            for name, offset, count in labels :
+                # random points can't start before the block or in the middle of a word of bits
+                first = max( offset, 0 ) // ppw
+                last = -( -min( offset + count, points ) // ppw )
+                label_words = ( last - first ) * wpp
+                for i in range( 0, label_words - 1, 2 ) :
+                    random_points.append( ( 'dwords', name, head + ( first + i // wpp ) * ppw, i ) )
+                if label_words % 2 :
+                    random_points.append( ( 'words', name, head + ( first + ( label_words - 1 ) // wpp ) * ppw,
+                                            label_words - 1 ) )
+            random_cost = sum( [ SLMP_COST['DEVICE'] + ( 4 if kind == 'dwords' else 2 ) +
+                                 SLMP_COST['FRAME'] / SLMP_SIZE['RANDOM'] for kind, *_ in random_points ] )
+            if random_cost < block_cost and len( set( p[2] for p in random_points ) ) == len( random_points ) :
+                for kind, name, index, offset in random_points :
+                    random[kind].append( { 'device': device, 'code': code, 'index': index,
+                                           'label': name, 'offset': offset } )
+            else :
+                blocks.append( ( 'bits' if unit < 1 else 'words', {
+                    'device': device, 'code': code, 'index': head, 'points': words if unit < 1 else points,
+                    'labels': [ { 'label': name, 'offset': offset, 'points': count } for name, offset, count in labels ]
+                }, words ) )
+    frames = [ ]
+    for frame in _plan_frames( [ ( ( k, b ), w ) for k, b, w in blocks ], SLMP_SIZE['BLOCK'], SLMP_SIZE['BATCH'] ) :
+        frames.append( { 'cmd': 'block', 'words': [ b for k, b in frame if k == 'words' ],
+                         'bits': [ b for k, b in frame if k == 'bits' ] } )
+    points = [ ( 'words', p ) for p in random['words'] ] + [ ( 'dwords', p ) for p in random['dwords'] ]
+    for frame in _plan_frames( [ ( p, 1 ) for p in points ], SLMP_SIZE['RANDOM'], SLMP_SIZE['RANDOM'] ) :
+        frames.append( { 'cmd': 'random', 'words': [ p for k, p in frame if k == 'words' ],
+                         'dwords': [ p for k, p in frame if k == 'dwords' ] } )
+    for frame in _plan_frames( [ ( p, 1 ) for p in random['bits'] ], SLMP_SIZE['RANDOM'], SLMP_SIZE['RANDOM'] ) :
+        frames.append( { 'cmd': 'random', 'bits': frame } )
+    return { 'type': 'write' if write else 'read', 'gap': 0 if write else gap, 'frames': frames, 'skipped': skipped }
+
+
+def to_plan ( table, names, gap=PLAN_GAP ) :
+    return { 'read': compile_plan( table, names, gap ), 'write': compile_plan( table, names, gap, True ) }
+
+
+def _bit_range ( code, index, sub, size ) :
+    # [ start, end ) of a device range in bits, word devices are counted in words of 8 * size bits
+    unit = SLMP_COMPATIBLE_DEVICES[ DEVICE_TYPES[ code ] ]['size']
+    if unit < 1 :
+        start = index
+    else :
+        start = index * int( unit * 8 ) + max( sub, 0 )
+    return start, start + max( 1, int( -( -size * 8 // 1 ) ) )
+
+
+class AddressIndex :
+    # interval tree over the device ranges of the labels, one per device code. Each code is a sorted slice of
+    # the arrays and the tree is implicit, the node of [lo,hi) is (lo+hi)//2 and keeps the max end of its slice
+    def __init__ ( self, code, start, end, name, length, names ) :
+        order = NP.lexsort( ( start, code ) )
+        self.code = NP.ascontiguousarray( code[ order ] )
+        self.start = NP.ascontiguousarray( start[ order ] )
+        self.end = NP.ascontiguousarray( end[ order ] )
+        self.name = NP.ascontiguousarray( name[ order ] )
+        self.length = NP.ascontiguousarray( length[ order ] )
+        self.names = names
+        self.max_end = NP.zeros_like( self.end )
+        self.slices = { }
+        codes, first = NP.unique( self.code, return_index=True )
+        for c, lo, hi in zip( codes.tolist(), first.tolist(), first[1:].tolist() + [ len( self.code ) ] ) :
+            self.slices[ c ] = ( lo, hi )
+            self._build( lo, hi )
+    def _build ( self, lo, hi ) :
+        if lo >= hi :
+            return 0
+        mid = ( lo + hi ) // 2
+        self.max_end[ mid ] = max( self.end[ mid ], self._build( lo, mid ), self._build( mid + 1, hi ) )
+        return self.max_end[ mid ]
+    def _query ( self, lo, hi, start, end, result ) :
+        if lo >= hi :
+            return
+        mid = ( lo + hi ) // 2
+        if self.max_end[ mid ] <= start :
+            return
+        self._query( lo, mid, start, end, result )
+        if self.start[ mid ] < end :
+            if self.end[ mid ] > start :
+                result.append( mid )
+            self._query( mid + 1, hi, start, end, result )
+    def _name ( self, i ) :
+        return bytes( self.names[ self.name[i] : self.name[i] + self.length[i] ] ).decode( 'utf-8' )
+    def find ( self, address, count=1 ) :
+        # label paths owning any of the count devices from address, like 'D12345' or 'W1A.3', raises AddressError
+        device = parse_address( address )
+        if device.code not in self.slices :
+            return [ ]
+        unit = device.size
+        start, end = _bit_range( device.code, device.index, -1 if device.sub is None else device.sub, 0.125 )
+        if count > 1 or ( unit >= 1 and device.sub is None ) :
+            end = start + max( 1, int( count * unit * 8 ) )
+        result = [ ]
+        self._query( *self.slices[ device.code ], start, end, result )
+        return [ self._name( i ) for i in result ]
+    def overlaps ( self ) :
+        # [ ( path, path ) ] of every pair of labels sharing a device
+        result = [ ]
+        for lo, hi in self.slices.values() :
+            for i in range( lo, hi ) :
+                found = [ ]
+                self._query( lo, hi, self.start[i], self.end[i], found )
+                result.extend( [ ( self._name( i ), self._name( j ) ) for j in sorted( found ) if j > i ] )
+        return result
+    def save ( self, filename ) :
+        NP.savez( filename + '.npz', code=self.code, start=self.start, end=self.end, name=self.name,
+                  length=self.length, names=NP.asarray( self.names ) )
+
+
+def to_index ( table, names ) :
+    ranges = [ _bit_range( int(row['code']), int(row['index']), int(row['sub']), row['size'] ) for row in table ]
+    start = NP.array( [ r[0] for r in ranges ], dtype=NP.int64 )
+    end = NP.array( [ r[1] for r in ranges ], dtype=NP.int64 )
+    return AddressIndex( table['code'], start, end, table['name'], table['length'], names )
+
+def load_index ( filename ) :
+    data = NP.load( filename + '.npz' )
+    return AddressIndex( data['code'], data['start'], data['end'], data['name'], data['length'], data['names'] )
+
+
+def to_sqlite ( filename, labels_dict, structs_dict, layout ) :
+    # write the catalog in a new database, replaced only once complete
+    if isfile( filename + '.tmp' ) :
+        remove( filename + '.tmp' )
+    db = sqlite3.connect( filename + '.tmp' )
+    try :
+        db.executescript( SQLITE_SCHEMA )
+        with db :
+            for typename, members in structs_dict.items() :
+                struct_layout = layout.getLayout( typename )
+                if struct_layout is None :
+                    continue
+                struct_id = db.execute( 'INSERT INTO struct_types ( name, size, align ) VALUES ( ?, ?, ? )',
+                                        ( typename, struct_layout['size'], struct_layout['align'] ) ).lastrowid
+                db.executemany( 'INSERT INTO struct_members ( struct_id, name, type, dimension, size, offset, comments ) '
+                                'VALUES ( ?, ?, ?, ?, ?, ?, ? )', [
+                    ( struct_id, name, member['type'], json.dumps( member['dimension'] ), member.get( 'size' ),
+                      struct_layout['members'][ name ]['offset'],
+                      json.dumps( member['comments'] ) if 'comments' in member else None )
+                    for name, member in members.items() if name in struct_layout['members'] ] )
+            for k, l in labels_dict.items() :
+                group_id = db.execute( 'INSERT INTO groups ( name ) VALUES ( ? )', ( k, ) ).lastrowid
+                for var in l :
+                    path = k + PATH_JOINER + var['name']
+                    variable_id = db.execute(
+                        'INSERT INTO variables ( group_id, name, path, type, dimension, size, address, const, retain, '
+                        'access, comments ) VALUES ( ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ? )',
+                        ( group_id, var['name'], path, var['type'], json.dumps( var['dimension'] ), var.get( 'size' ),
+                          var.get( 'address' ), var.get( 'const' ), var.get( 'retain' ), var.get( 'access' ),
+                          json.dumps( var['comments'] ) if 'comments' in var else None ) ).lastrowid
+                    db.executemany( 'INSERT INTO leaves ( variable_id, path, type, address, device, device_code, '
+                                    'device_index, device_sub ) VALUES ( ?, ?, ?, ?, ?, ?, ?, ? )', [
+                        ( variable_id, leaf_path, leaftype, address['source'], address['type'], address['code'],
+                          address['index'], address.get( 'sub' ) )
+                        for leaf_path, leaftype, address in expand_leaves( { k: [ var ] }, layout ) ] )
+        db.execute( 'ANALYZE' )
+    finally :
+        db.close()
+    replace( filename + '.tmp', filename )
+
+def open_catalog ( filename ) :
+    db = sqlite3.connect( 'file:{}?mode=ro'.format( filename ), uri=True )
+    db.row_factory = sqlite3.Row
+    return db
+
+def find_leaf ( db, path ) :
+    # leaf with a path like Group.Var[3].Member, None if missing
+    return db.execute( 'SELECT * FROM leaves WHERE path = ?', ( path, ) ).fetchone()
+
+def find_prefix ( db, prefix ) :
+    # leaves whose path starts with prefix, the range keeps the path index in use
+    return db.execute( 'SELECT * FROM leaves WHERE path >= ? AND path < ? ORDER BY path',
+                       ( prefix, prefix + chr( 0x10FFFF ) ) ).fetchall()
+
+def find_address ( db, address, count=1 ) :
+    # leaves starting in the count points of the device from address, like D100
+    decoded = parse_address( address )
+    return db.execute( 'SELECT * FROM leaves WHERE device_code = ? AND device_index >= ? AND device_index < ? '
+                       'ORDER BY device_index, device_sub', ( decoded['code'], decoded['index'],
+                                                              decoded['index'] + count ) ).fetchall()
+
+
+def test ( folder='test_xml' ) :
+    # convert a small synthetic export, see generator.py
+    from generator import generate
+    generate( folder, leaves=100 )
+    structs_dict = VarStruct.getStructCatalog( load_structs( join(folder,STRUCTS_FILE) ) )
+    labs = to_dict_files( list_label_files(folder), structs_dict )
+    to_csv_files( labs, folder )
 
 
 # TODO : Quando ho un array devo spostare alcuni dettagli a monte e lasciare dentro struct sempre l'organizzazione ad array multilivello
@@ -505,16 +1772,78 @@ def test ( ) :
 '''
 
 if __name__=="__main__":
-    labs = {}
-    structs_tree = load_structs( join(sys.argv[1],"sdt.xml") )
-    for filename in listdir(sys.argv[1]):
-        print(filename)
-        if not filename.endswith(".xml") or filename == "sdt.xml":
-            continue
-        print("keep")
-        labels_tree = load_labels( join(sys.argv[1],filename) )
-        labs = to_dict(labels_tree, structs_tree, labs)
-        print("done")
-    dict_result = to_json(labs)
-    with open ( join(sys.argv[1],"labels.json"), 'w' ) as output_file:
-        json.dump( dict_result, output_file, indent=4 )
+    parser = argparse.ArgumentParser( description='Convert GX Works label exports into labels.json' )
+    parser.add_argument( 'folder', help='folder with the exported label files and {}'.format(STRUCTS_FILE) )
+    parser.add_argument( '-j', '--workers', type=int, default=1, help='number of worker processes (0 : one per cpu)' )
+    parser.add_argument( '--cache-dir', help='build cache folder (default : <folder>/{})'.format(CACHE_FOLDER) )
+    parser.add_argument( '--cache-size', type=int, default=CACHE_SIZE>>20, help='build cache size limit in MB' )
+    parser.add_argument( '--no-cache', action='store_true', help='ignore the build cache and convert every file' )
+    parser.add_argument( '--compact', action='store_true', help='write labels.json without indentation' )
+    parser.add_argument( '--compact-arrays', action='store_true',
+                         help='write evenly spaced arrays of structs as their first element and the strides' )
+    parser.add_argument( '--npy', action='store_true', help='also write the columnar label table as .npy' )
+    parser.add_argument( '--plan', action='store_true', help='also write the SLMP access plan as _plan.json' )
+    parser.add_argument( '--gap', type=int, default=PLAN_GAP, help='largest gap in words merged into a read block' )
+    parser.add_argument( '--leaves', action='store_true', help='also write the address of every element as _leaves.json' )
+    parser.add_argument( '--index', action='store_true', help='also write the device to label index as _index.npz' )
+    parser.add_argument( '--sqlite', action='store_true', help='also write the label catalog as .db' )
+    parser.add_argument( '--csv', action='store_true', help='also write a GOT csv file for each label group' )
+    parser.add_argument( '--stats', action='store_true', help='print the time and counters of each stage' )
+    parser.add_argument( '--stats-file', help='write the time and counters of each stage as json' )
+    args = parser.parse_args()
+    STATS.enabled = args.stats or args.stats_file is not None
+    workers = args.workers or cpu_count() or 1
+    cache = None
+    if not args.no_cache :
+        cache = LabelCache( args.cache_dir or join(args.folder,CACHE_FOLDER), join(args.folder,STRUCTS_FILE),
+                            args.cache_size<<20 )
+    structs_tree = load_structs( join(args.folder,STRUCTS_FILE) )
+    structs_dict = VarStruct.getStructCatalog( structs_tree )
+    layout = VarLayout( structs_dict )
+    labs = to_dict_files( list_label_files(args.folder), structs_dict, workers=workers, cache=cache )
+    with open ( join(args.folder,LABELS_FILE), 'w' ) as output_file:
+        dump_json( labs, output_file, indent=None if args.compact else 4, layout=layout, compact=args.compact_arrays )
+    output_name = join(args.folder,LABELS_FILE.rsplit('.',1)[0])
+    if args.npy or args.plan or args.index :
+        with STATS.stage( 'table' ) :
+            errors = [ ]
+            table, names = to_table(labs, layout, errors)
+        STATS.count( 'table_rows', len(table) )
+        # labels without a device address or on devices out of SLMP are skipped silently
+        for error in errors :
+            if error.reason in ( ADDRESS_ERRORS[ ADDRESS_INDEX ], ADDRESS_ERRORS[ ADDRESS_SUB ] ) :
+                print( "WARNING : {} : {} : {}".format(error.path, error.address, error.reason) )
+    if args.npy :
+        to_npy( output_name, table, names )
+    if args.leaves :
+        with STATS.stage( 'leaves' ), open ( output_name + '_leaves.json', 'w' ) as output_file:
+            json.dump( { path: { 'type': leaftype, 'address': address.asdict( LEAF_ADDRESS_KEYS ) }
+                         for path, leaftype, address in expand_leaves(labs, layout) },
+                       output_file, indent=None if args.compact else 4 )
+    if args.index :
+        with STATS.stage( 'index' ) :
+            index = to_index(table, names)
+            overlaps = index.overlaps()
+        for owner, label in overlaps :
+            print( "WARNING : {} : overlaps : {}".format(label, owner) )
+        index.save( output_name + '_index' )
+    if args.plan :
+        with STATS.stage( 'plan' ), open ( output_name + '_plan.json', 'w' ) as output_file:
+            plan = to_plan(table, names, args.gap)
+            json.dump( plan, output_file, indent=None if args.compact else 4 )
+        # every element of the table must be in the read plan, import here as decoder imports this module
+        from decoder import plan_ranges, uncovered_elements
+        rows, _ = uncovered_elements( table, plan_ranges( plan['read'] ) )
+        for row, n in zip( *NP.unique( rows, return_counts=True ) ) :
+            print( "WARNING : {} : {} elements out of the read plan".format(table_name(names, table[row]), n) )
+    if args.sqlite :
+        with STATS.stage( 'sqlite' ) :
+            to_sqlite( output_name + '.db', labs, structs_dict, layout )
+    if args.csv :
+        with STATS.stage( 'csv' ) :
+            to_csv_files( labs, args.folder, workers )
+    if args.stats :
+        print( STATS.summary(), file=sys.stderr )
+    if args.stats_file :
+        with open ( args.stats_file, 'w' ) as output_file:
+            json.dump( STATS.report(), output_file, indent=4 )
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+import asyncio
+import argparse
+import json
+import random
+import struct
+import sys
+import numpy as NP
+from os.path import join
+
+import loader
+from loader import SLMP_COMPATIBLE_DEVICES, SLMP_SIZE, DEVICE_TYPES, TYPE_SIZE
+from slmp import SLMP_CMD, SLMP_HEADER, SLMP_SIZE_BITS, SLMP_CPUTYPE, SLMPError, \
+    frame_size, encode_frame, decode_device, pack_bits, unpack_bits
+
+# SLMP PLC simulator, answers the requests of slmp.py and lib/client.js from device memory kept in NumPy arrays
+
+SIM_POINTS = 65536  # points of each device
+SIM_CPU = ( 'R04CPU', 0x4800 )
+# end codes of the failed requests
+SIM_ERRORS = {
+    'COMMAND': 0xC059,  # unsupported command or subcommand
+    'POINTS': 0xC051,  # number of points out of range
+    'RANGE': 0xC056,  # device out of range
+    'DEVICE': 0xC05B,  # device can't be accessed this way
+    'REQUEST': 0xC061  # malformed request
+}
+SIM_COUNTERS = [ 'requests', 'errors', 'bytes_in', 'bytes_out', 'points_read', 'points_written' ]
+
+VALUE_FORMATS = {
+    'INT': '<h',
+    'DINT': '<i',
+    'WORD': '<H',
+    'DWORD': '<I',
+    'REAL': '<f',
+    'LREAL': '<d'
+}
+
+
+def encode_value ( vartype, value, size=1 ) :
+    # little endian bytes of a scalar value, strings are padded with zeros to size characters
+    if vartype in ( 'string', 'wstring' ) :
+        value = str( value )
+        if len( value ) > 1 and value[0] == value[-1] == "'" :
+            value = value[1:-1]
+        if vartype == 'string' :
+            return value.encode( 'ascii', 'replace' )[:size].ljust( size, b'\0' )
+        return value.encode( 'utf-16-le' )[:size*2].ljust( size*2, b'\0' )
+    return struct.pack( VALUE_FORMATS[ vartype ], value )
+
+
+class DeviceMemory :
+    # one array per device code, allocated on first access : a byte per point for bit devices, the raw little endian
+    # bytes of the points for the others. Word access to bit devices packs 16 points per word.
+    def __init__ ( self, points=SIM_POINTS ) :
+        self.points = points
+        self.devices = { }
+    def unit ( self, code ) :
+        if code not in DEVICE_TYPES :
+            raise SLMPError( 'unsupported device code 0x{:02X}'.format( code ), SIM_ERRORS['DEVICE'] )
+        return SLMP_COMPATIBLE_DEVICES[ DEVICE_TYPES[ code ] ]['size']
+    def device ( self, code ) :
+        if code not in self.devices :
+            unit = self.unit( code )
+            self.devices[ code ] = NP.zeros( self.points * ( 1 if unit < 1 else int( unit ) ), 'u1' )
+        return self.devices[ code ]
+    def _slice ( self, code, index, nbytes ) :
+        # bytes of a word device, bits of a bit device, from point index
+        unit = self.unit( code )
+        start, stop = ( index, index + nbytes * 8 ) if unit < 1 else ( int( index * unit ), int( index * unit ) + nbytes )
+        memory = self.device( code )
+        if stop > len( memory ) :
+            raise SLMPError( 'device out of range : {}{}'.format( DEVICE_TYPES[ code ], index ), SIM_ERRORS['RANGE'] )
+        return memory[ start : stop ], unit < 1
+    def read ( self, code, index, nbytes ) :
+        memory, bit = self._slice( code, index, nbytes )
+        return NP.packbits( memory, bitorder='little' ).tobytes() if bit else memory.tobytes()
+    def write ( self, code, index, data ) :
+        memory, bit = self._slice( code, index, len( data ) )
+        data = NP.frombuffer( data, 'u1' )
+        memory[:] = NP.unpackbits( data, bitorder='little' ) if bit else data
+    def readBits ( self, code, index, points ) :
+        if self.unit( code ) >= 1 :
+            raise SLMPError( 'not a bit device : {}'.format( DEVICE_TYPES[ code ] ), SIM_ERRORS['DEVICE'] )
+        return self._slice( code, index, -( -points // 8 ) )[0][:points]
+    def writeBits ( self, code, index, values ) :
+        self.readBits( code, index, len( values ) )[:] = values
+    def writeValue ( self, address, vartype, value, size=1 ) :
+        # address decoded by loader.decode_address, bools of word devices go in the bit sub of the word
+        if vartype != 'BOOL' :
+            self.write( address['code'], address['index'], encode_value( vartype, value, size ) )
+        elif self.unit( address['code'] ) < 1 :
+            self.writeBits( address['code'], address['index'], [ bool( value ) ] )
+        else :
+            sub = address.get( 'sub', 0 )
+            memory = self._slice( address['code'], address['index'], int( self.unit( address['code'] ) ) )[0]
+            memory[ sub // 8 ] = int( memory[ sub // 8 ] ) & ~( 1 << sub % 8 ) | bool( value ) << sub % 8
+
+    def seed ( self, labels_dict, layout ) :
+        # write the initial value of every element of the labels with an address, returns the elements written
+        count = 0
+        for path, var in loader.iter_leaves( labels_dict ) :
+            if not var.get( 'value' ) or var['type'] not in TYPE_SIZE :
+                continue
+            address = loader.decode_address( var )
+            if 'code' not in address :
+                continue
+            for _, leaftype, offset in layout.getElementLeaves( var['type'], var['dimension'], var.get( 'size', 1 ) ) :
+                try :
+                    self.writeValue( loader.offset_address( address, offset, leaftype == 'BOOL' ), leaftype,
+                                     var['value'], var.get( 'size', 1 ) )
+                    count += 1
+                except ( SLMPError, struct.error ) as ex :
+                    print( 'ERROR : {} : {}'.format( path, ex ) )
+        return count
+
+
+#-----------------------------------------------------------------------------------------------------------------------
+class SLMPSimulator :
+    # answers SLMP 3E and 4E frames from a DeviceMemory, the responses are delayed by latency +/- jitter seconds,
+    # drawn from a seeded generator so that runs can be repeated
+
+    def __init__ ( self, memory=None, cpu=SIM_CPU, latency=0, jitter=0, seed=0 ) :
+        self.memory = memory if memory is not None else DeviceMemory()
+        self.cpu = cpu
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = random.Random( seed )
+        self.counters = dict.fromkeys( SIM_COUNTERS, 0 )
+        self.commands = {
+            SLMP_CMD['TYPE']: self.cpuType,
+            SLMP_CMD['ECHO']: self.echo,
+            SLMP_CMD['READ']: self.batchRead,
+            SLMP_CMD['WRITE']: self.batchWrite,
+            SLMP_CMD['READ_R']: self.randomRead,
+            SLMP_CMD['WRITE_R']: self.randomWrite,
+            SLMP_CMD['READ_B']: self.blockRead,
+            SLMP_CMD['WRITE_B']: self.blockWrite
+        }
+
+    def reset ( self ) :
+        self.counters = dict.fromkeys( SIM_COUNTERS, 0 )
+
+    def delay ( self ) :
+        if not self.jitter :
+            return self.latency
+        return max( 0, self.latency + self.rng.uniform( -self.jitter, self.jitter ) )
+
+    def handle ( self, frame ) :
+        # response to a complete request frame
+        frame = memoryview( frame )
+        self.counters['requests'] += 1
+        self.counters['bytes_in'] += len( frame )
+        header = SLMP_HEADER[ frame[0] ]
+        serial = int.from_bytes( frame[2:4], 'little' ) if header == 13 else 0
+        try :
+            # the monitor timer is skipped
+            command, subcommand = struct.unpack_from( '<HH', frame, header + 2 )
+            if command not in self.commands or subcommand & ~3 :
+                raise SLMPError( 'unsupported command 0x{:04X} 0x{:04X}'.format( command, subcommand ),
+                                 SIM_ERRORS['COMMAND'] )
+            payload = self.commands[ command ]( frame, header + 6, 'R' if subcommand & 2 else 'Q', subcommand & 1 )
+            code = 0
+        except SLMPError as ex :
+            payload, code = b'', ex.code
+        except ( struct.error, IndexError, ValueError ) :
+            payload, code = b'', SIM_ERRORS['REQUEST']
+        if code :
+            self.counters['errors'] += 1
+        response = encode_frame( frame[0] | 0x80, serial, bytes( frame[header-7:header-2] ) +
+                                 struct.pack( '<H', code ) + payload )
+        self.counters['bytes_out'] += len( response )
+        return response
+
+    #-------------------------------------------------------------------------------------------------------------------
+    def _points ( self, points, limit ) :
+        if not 0 < points <= limit :
+            raise SLMPError( 'wrong number of points : {}'.format( points ), SIM_ERRORS['POINTS'] )
+
+    def cpuType ( self, frame, offset, series, bit ) :
+        return self.cpu[0].encode( 'ascii' ).ljust( SLMP_CPUTYPE ) + struct.pack( '<H', self.cpu[1] )
+
+    def echo ( self, frame, offset, series, bit ) :
+        length, = struct.unpack_from( '<H', frame, offset )
+        return bytes( frame[offset:offset+2+length] )
+
+    def batchRead ( self, frame, offset, series, bit ) :
+        code, index, offset = decode_device( frame, offset, series )
+        points, = struct.unpack_from( '<H', frame, offset )
+        self._points( points, SLMP_SIZE_BITS if bit else SLMP_SIZE['BATCH'] )
+        self.counters['points_read'] += points
+        if bit :
+            return pack_bits( self.memory.readBits( code, index, points ) )
+        return self.memory.read( code, index, points * 2 )
+
+    def batchWrite ( self, frame, offset, series, bit ) :
+        code, index, offset = decode_device( frame, offset, series )
+        points, = struct.unpack_from( '<H', frame, offset )
+        self._points( points, SLMP_SIZE_BITS if bit else SLMP_SIZE['BATCH'] )
+        data = frame[offset+2:]
+        if len( data ) != ( ( points + 1 ) // 2 if bit else points * 2 ) :
+            raise SLMPError( 'wrong data length : {}'.format( len( data ) ), SIM_ERRORS['REQUEST'] )
+        if bit :
+            self.memory.writeBits( code, index, unpack_bits( data, points ) )
+        else :
+            self.memory.write( code, index, data )
+        self.counters['points_written'] += points
+        return b''
+
+    def randomRead ( self, frame, offset, series, bit ) :
+        words, dwords = frame[offset], frame[offset+1]
+        self._points( words + dwords, SLMP_SIZE['RANDOM'] )
+        offset += 2
+        result = [ ]
+        for i in range( words + dwords ) :
+            code, index, offset = decode_device( frame, offset, series )
+            result.append( self.memory.read( code, index, 2 if i < words else 4 ) )
+        self.counters['points_read'] += words + dwords
+        return b''.join( result )
+
+    def randomWrite ( self, frame, offset, series, bit ) :
+        if bit :
+            # 1 byte for each value, 2 for iQ-R
+            bits = frame[offset]
+            self._points( bits, SLMP_SIZE['RANDOM'] )
+            offset += 1
+            size = 2 if series == 'R' else 1
+            for _ in range( bits ) :
+                code, index, offset = decode_device( frame, offset, series )
+                self.memory.writeBits( code, index, [ bool( int.from_bytes( frame[offset:offset+size], 'little' ) ) ] )
+                offset += size
+            self.counters['points_written'] += bits
+            return b''
+        words, dwords = frame[offset], frame[offset+1]
+        self._points( words + dwords, SLMP_SIZE['RANDOM'] )
+        offset += 2
+        for i in range( words + dwords ) :
+            code, index, offset = decode_device( frame, offset, series )
+            size = 2 if i < words else 4
+            if offset + size > len( frame ) :
+                raise SLMPError( 'wrong data length', SIM_ERRORS['REQUEST'] )
+            self.memory.write( code, index, frame[offset:offset+size] )
+            offset += size
+        self.counters['points_written'] += words + dwords
+        return b''
+
+    def _blocks ( self, frame, offset, series ) :
+        # [ ( code, index, points, bit block ) ], offset after the blocks
+        words, bits = frame[offset], frame[offset+1]
+        self._points( words + bits, SLMP_SIZE['BLOCK'] )
+        offset += 2
+        blocks = [ ]
+        for i in range( words + bits ) :
+            code, index, offset = decode_device( frame, offset, series )
+            points, = struct.unpack_from( '<H', frame, offset )
+            blocks.append( ( code, index, points, i >= words ) )
+            offset += 2
+        self._points( sum( [ b[2] for b in blocks ] ), SLMP_SIZE['BATCH'] )
+        return blocks, offset
+
+    def blockRead ( self, frame, offset, series, bit ) :
+        blocks, _ = self._blocks( frame, offset, series )
+        self.counters['points_read'] += sum( [ b[2] * ( 16 if b[3] else 1 ) for b in blocks ] )
+        return b''.join( [ self.memory.read( code, index, points * 2 ) for code, index, points, _ in blocks ] )
+
+    def blockWrite ( self, frame, offset, series, bit ) :
+        # each block is followed by its data
+        words, bits = frame[offset], frame[offset+1]
+        self._points( words + bits, SLMP_SIZE['BLOCK'] )
+        offset += 2
+        for i in range( words + bits ) :
+            code, index, offset = decode_device( frame, offset, series )
+            points, = struct.unpack_from( '<H', frame, offset )
+            offset += 2
+            if offset + points * 2 > len( frame ) :
+                raise SLMPError( 'wrong data length', SIM_ERRORS['REQUEST'] )
+            self.memory.write( code, index, frame[offset:offset+points*2] )
+            offset += points * 2
+            self.counters['points_written'] += points * ( 16 if i >= words else 1 )
+        return b''
+
+    #-------------------------------------------------------------------------------------------------------------------
+    async def serve ( self, host='127.0.0.1', port=5007, udp_port=None ) :
+        # TCP server on port and, if udp_port is given, UDP endpoint on udp_port, returns both to be closed
+        loop = asyncio.get_running_loop()
+        servers = [ await loop.create_server( lambda: SimulatorStream( self ), host, port ) ]
+        if udp_port is not None :
+            transport, _ = await loop.create_datagram_endpoint( lambda: SimulatorDatagram( self ),
+                                                                local_addr=( host, udp_port ) )
+            servers.append( transport )
+        return servers
+
+
+class SimulatorStream ( asyncio.Protocol ) :
+    def __init__ ( self, simulator ) :
+        self.simulator = simulator
+        self.buffer = bytearray()
+        self.transport = None
+    def connection_made ( self, transport ) :
+        self.transport = transport
+    def data_received ( self, data ) :
+        self.buffer += data
+        try :
+            size = frame_size( self.buffer )
+        except SLMPError :
+            self.transport.close()
+            return
+        while size is not None and len( self.buffer ) >= size :
+            response = self.simulator.handle( bytes( self.buffer[:size] ) )
+            del self.buffer[:size]
+            self.send( response )
+            try :
+                size = frame_size( self.buffer )
+            except SLMPError :
+                self.transport.close()
+                return
+    def send ( self, response ) :
+        delay = self.simulator.delay()
+        if delay :
+            asyncio.get_running_loop().call_later( delay, self._write, response )
+        else :
+            self._write( response )
+    def _write ( self, response ) :
+        if not self.transport.is_closing() :
+            self.transport.write( response )
+
+class SimulatorDatagram ( asyncio.DatagramProtocol ) :
+    def __init__ ( self, simulator ) :
+        self.simulator = simulator
+        self.transport = None
+    def connection_made ( self, transport ) :
+        self.transport = transport
+    def datagram_received ( self, data, addr ) :
+        try :
+            if frame_size( data ) != len( data ) :
+                return
+        except SLMPError :
+            return
+        response = self.simulator.handle( data )
+        delay = self.simulator.delay()
+        if delay :
+            asyncio.get_running_loop().call_later( delay, self.transport.sendto, response, addr )
+        else :
+            self.transport.sendto( response, addr )
+
+
+#-----------------------------------------------------------------------------------------------------------------------
+def load_memory ( folder, points=SIM_POINTS ) :
+    # device memory seeded with the initial values of the label exports in folder
+    structs_dict = loader.VarStruct.getStructCatalog( loader.load_structs( join( folder, loader.STRUCTS_FILE ) ) )
+    labels_dict = loader.to_dict_files( loader.list_label_files( folder ), structs_dict )
+    memory = DeviceMemory( points )
+    memory.seed( labels_dict, loader.VarLayout( structs_dict ) )
+    return memory
+
+async def run ( simulator, host, port, udp_port=None, duration=None ) :
+    # serve for duration seconds, forever if None
+    servers = await simulator.serve( host, port, udp_port )
+    try :
+        await asyncio.sleep( duration if duration else float( 'inf' ) )
+    finally :
+        for server in servers :
+            server.close()
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser( description='Simulate a PLC answering SLMP requests over TCP and UDP' )
+    parser.add_argument( 'folder', nargs='?', help='folder with the label exports and {} to seed the devices'
+                         .format( loader.STRUCTS_FILE ) )
+    parser.add_argument( '--host', default='127.0.0.1' )
+    parser.add_argument( '-p', '--port', type=int, default=5007 )
+    parser.add_argument( '--udp-port', type=int, help='UDP port, same as the TCP one if missing' )
+    parser.add_argument( '--no-udp', action='store_true' )
+    parser.add_argument( '--cpu', default=SIM_CPU[0], help='CPU type, iQ-R if it starts with R' )
+    parser.add_argument( '--cpu-code', type=lambda x: int( x, 0 ), default=SIM_CPU[1] )
+    parser.add_argument( '--points', type=int, default=SIM_POINTS, help='points of each device' )
+    parser.add_argument( '--latency', type=float, default=0, help='response delay in ms' )
+    parser.add_argument( '--jitter', type=float, default=0, help='random variation of the delay in ms' )
+    parser.add_argument( '--seed', type=int, default=0 )
+    parser.add_argument( '--duration', type=float, help='seconds before exiting, forever if missing' )
+    args = parser.parse_args()
+    memory = load_memory( args.folder, args.points ) if args.folder else DeviceMemory( args.points )
+    simulator = SLMPSimulator( memory, ( args.cpu, args.cpu_code ), args.latency / 1000, args.jitter / 1000,
+                               args.seed )
+    # counters are printed when the simulation ends, also on ctrl-c
+    try :
+        asyncio.run( run( simulator, args.host, args.port, None if args.no_udp else args.udp_port or args.port,
+                          args.duration ) )
+    except KeyboardInterrupt :
+        pass
+    json.dump( simulator.counters, sys.stdout, indent=4 )
+    print()
@@ -0,0 +1,533 @@
+#!/usr/bin/env python3
+import asyncio
+import argparse
+import json
+import struct
+import sys
+import numpy as NP
+from time import perf_counter
+
+from loader import SLMP_COMPATIBLE_DEVICES, SLMP_SIZE, Record, parse_address
+
+# asyncio SLMP client, same frames as SLMP_Client in lib/client.js. 3E frames are matched in order, so only one
+# request at a time is sent on each connection, 4E frames carry a serial number and many can be in flight.
+
+SLMP_ARGS = {
+    'SUBHEADER': 0x50,  # 3E request, the response is 0xD0
+    'SUBHEADER_4E': 0x54,  # 4E request, the response is 0xD4
+    'DEST_NETWORK': 0x00,
+    'DEST_STATION': 0xFF,
+    'DEST_MODULE': 0x03FF,  # CPU module
+    'DEST_MULTI': 0x00,
+    'MNTR_TIMER': 0x04  # waiting time of the PLC x250ms
+}
+SLMP_CMD = {
+    'TYPE': 0x0101,
+    'RUN': 0x1001,
+    'STOP': 0x1002,
+    'PAUSE': 0x1003,
+    'CLEAR': 0x1005,
+    'RESET': 0x1006,
+    'ECHO': 0x0619,
+    'READ': 0x0401,
+    'WRITE': 0x1401,
+    'READ_R': 0x0403,
+    'WRITE_R': 0x1402,
+    'READ_B': 0x0406,
+    'WRITE_B': 0x1406
+}
+# bit points in a batch access, words are SLMP_SIZE['BATCH']
+SLMP_SIZE_BITS = 3584
+# header up to the data length included, the data length counts from the monitor timer or the end code
+SLMP_HEADER = { 0x50: 9, 0xD0: 9, 0x54: 13, 0xD4: 13 }
+SLMP_CPUTYPE = 16
+
+# seconds, lib/const.js SOCKET_ARGS are in ms
+SOCKET_ARGS = {
+    'CONN_TIMEOUT': 1.0,
+    'DATA_TIMEOUT': 1.0
+}
+SLMP_WINDOW = 8  # requests in flight on a 4E connection
+SLMP_POOL = 4  # connections of a pool
+
+
+class SLMPError ( Exception ) :
+    # the PLC answered with an end code other than 0, or with a payload of the wrong size
+    def __init__ ( self, message, code=0, command=0, payload=b'' ) :
+        super().__init__( message )
+        self.code = code
+        self.command = command
+        self.payload = bytes( payload )
+
+
+#-----------------------------------------------------------------------------------------------------------------------
+# Frames, shared with the simulator
+def frame_size ( data ) :
+    # total size of the frame at the start of data, None until its header arrived
+    if not data :
+        return None
+    header = SLMP_HEADER.get( data[0] )
+    if header is None :
+        raise SLMPError( 'unknown subheader 0x{:02X}'.format( data[0] ) )
+    if len( data ) < header :
+        return None
+    return header + int.from_bytes( data[header-2:header], 'little' )
+
+def encode_frame ( subheader, serial, body ) :
+    # body starts with the network number, the data length is filled in here
+    if subheader in ( 0x50, 0xD0 ) :
+        head = struct.pack( '<H', subheader )
+    else :
+        head = struct.pack( '<HHH', subheader, serial, 0 )
+    return head + body[:5] + struct.pack( '<H', len( body ) - 5 ) + body[5:]
+
+def encode_request ( command, subcommand=0, data=b'', serial=None, timer=SLMP_ARGS['MNTR_TIMER'], dest=None ) :
+    # 3E frame if serial is None, 4E otherwise
+    network, station, module, multi = dest or ( SLMP_ARGS['DEST_NETWORK'], SLMP_ARGS['DEST_STATION'],
+                                                SLMP_ARGS['DEST_MODULE'], SLMP_ARGS['DEST_MULTI'] )
+    body = struct.pack( '<BBHBHHH', network, station, module, multi, timer, command, subcommand ) + bytes( data )
+    if serial is None :
+        return encode_frame( SLMP_ARGS['SUBHEADER'], 0, body )
+    return encode_frame( SLMP_ARGS['SUBHEADER_4E'], serial, body )
+
+def decode_response ( frame ) :
+    # ( serial or None for 3E, end code, payload ), the payload is a view on frame
+    frame = memoryview( frame )
+    header = SLMP_HEADER[ frame[0] ]
+    serial = None if header == 9 else int.from_bytes( frame[2:4], 'little' )
+    return serial, int.from_bytes( frame[header:header+2], 'little' ), frame[header+2:]
+
+def device_code ( device ) :
+    # ( code, index ) of 'D100', ( 'D', 100 ), ( 0xA8, 100 ) or a decoded address
+    if isinstance( device, str ) :
+        device = parse_address( device )
+    if isinstance( device, ( dict, Record ) ) :
+        return device['code'], device['index']
+    code, index = device
+    if isinstance( code, str ) :
+        code = SLMP_COMPATIBLE_DEVICES[ code ]['code']
+    return code, index
+
+def encode_device ( device, series='Q' ) :
+    # Q/L series : 3 bytes of index and 1 of code, iQ-R : 4 bytes of index and 2 of code
+    code, index = device_code( device )
+    if series == 'R' :
+        return struct.pack( '<IH', index, code )
+    return struct.pack( '<I', index & 0xFFFFFF | code << 24 )
+
+def decode_device ( data, offset=0, series='Q' ) :
+    # ( code, index, offset after the device ) of a device encoded by encode_device
+    if series == 'R' :
+        index, code = struct.unpack_from( '<IH', data, offset )
+        return code, index, offset + 6
+    value, = struct.unpack_from( '<I', data, offset )
+    return value >> 24, value & 0xFFFFFF, offset + 4
+
+def pack_bits ( values ) :
+    # 2 bits per byte, the first one in the high nibble
+    bits = NP.asarray( values, dtype=bool ).astype( 'u1' )
+    if len( bits ) % 2 :
+        bits = NP.append( bits, NP.uint8( 0 ) )
+    return ( bits[0::2] << 4 | bits[1::2] ).tobytes()
+
+def unpack_bits ( data, count ) :
+    nibbles = NP.frombuffer( data, dtype='u1' )
+    return NP.stack( ( nibbles >> 4 & 1, nibbles & 1 ), axis=1 ).ravel()[:count].astype( bool )
+
+def pack_words ( values ) :
+    # bytes-like values and arrays are sent as their raw bytes, anything else as 16 bits words
+    if isinstance( values, ( bytes, bytearray, memoryview ) ) :
+        return bytes( values )
+    if isinstance( values, NP.ndarray ) :
+        return values.tobytes()
+    return NP.asarray( values ).astype( '<u2' ).tobytes()
+
+
+#-----------------------------------------------------------------------------------------------------------------------
+class SLMPStream ( asyncio.Protocol ) :
+    # splits the TCP stream in frames
+    def __init__ ( self, client ) :
+        self.client = client
+        self.buffer = bytearray()
+    def data_received ( self, data ) :
+        self.buffer += data
+        try :
+            size = frame_size( self.buffer )
+            while size is not None and len( self.buffer ) >= size :
+                self.client.response( bytes( self.buffer[:size] ) )
+                del self.buffer[:size]
+                size = frame_size( self.buffer )
+        except SLMPError as ex :
+            # out of sync, the rest of the stream can't be trusted
+            self.client.lost( ex )
+    def connection_lost ( self, exc ) :
+        self.client.lost( exc )
+
+class SLMPDatagram ( asyncio.DatagramProtocol ) :
+    # one frame per datagram
+    def __init__ ( self, client ) :
+        self.client = client
+    def datagram_received ( self, data, addr ) :
+        self.client.response( data )
+    def error_received ( self, exc ) :
+        self.client.lost( exc )
+    def connection_lost ( self, exc ) :
+        self.client.lost( exc )
+
+
+#-----------------------------------------------------------------------------------------------------------------------
+class SLMPCommands :
+    # SLMP commands on top of request( command, subcommand, data ), for a client or a pool of clients
+
+    def _subcommand ( self, bit=False ) :
+        return int( bool( bit ) ) | ( self.series == 'R' ) << 1
+
+    def _device ( self, device ) :
+        return encode_device( device, self.series )
+
+    @staticmethod
+    def _check ( command, payload, length ) :
+        if len( payload ) != length :
+            raise SLMPError( 'response length {} instead of {}'.format( len( payload ), length ),
+                             command=command, payload=payload )
+        return payload
+
+    #-------------------------------------------------------------------------------------------------------------------
+    async def getCpuType ( self ) :
+        payload = await self.request( SLMP_CMD['TYPE'] )
+        self._check( SLMP_CMD['TYPE'], payload, SLMP_CPUTYPE + 2 )
+        return { 'type': bytes( payload[:SLMP_CPUTYPE] ).decode( 'ascii' ).strip(),
+                 'code': int.from_bytes( payload[SLMP_CPUTYPE:], 'little' ) }
+
+    async def testEcho ( self, data ) :
+        payload = await self.request( SLMP_CMD['ECHO'], 0, struct.pack( '<H', len( data ) ) + bytes( data ) )
+        return bytes( self._check( SLMP_CMD['ECHO'], payload, len( data ) + 2 )[2:] )
+
+    async def batchRead ( self, head, points, bit=False ) :
+        # raw words, or an array of bools for bit access
+        if not 0 < points <= ( SLMP_SIZE_BITS if bit else SLMP_SIZE['BATCH'] ) :
+            raise ValueError( 'wrong size : {} : {}'.format( head, points ) )
+        payload = await self.request( SLMP_CMD['READ'], self._subcommand( bit ),
+                                      self._device( head ) + struct.pack( '<H', points ) )
+        if bit :
+            return unpack_bits( self._check( SLMP_CMD['READ'], payload, ( points + 1 ) // 2 ), points )
+        return self._check( SLMP_CMD['READ'], payload, points * 2 )
+
+    async def batchWrite ( self, head, values, bit=False ) :
+        data = pack_bits( values ) if bit else pack_words( values )
+        points = len( values ) if bit else len( data ) // 2
+        if not 0 < points <= ( SLMP_SIZE_BITS if bit else SLMP_SIZE['BATCH'] ) :
+            raise ValueError( 'wrong size : {} : {}'.format( head, points ) )
+        await self.request( SLMP_CMD['WRITE'], self._subcommand( bit ),
+                            self._device( head ) + struct.pack( '<H', points ) + data )
+
+    async def randomRead ( self, words, dwords=() ) :
+        # arrays of the values of each word and dword device
+        if not 0 < len( words ) + len( dwords ) <= SLMP_SIZE['RANDOM'] :
+            raise ValueError( 'wrong number of devices : {} : {}'.format( len( words ), len( dwords ) ) )
+        data = [ struct.pack( '<BB', len( words ), len( dwords ) ) ] + \
+               [ self._device( device ) for device in words ] + [ self._device( device ) for device in dwords ]
+        payload = await self.request( SLMP_CMD['READ_R'], self._subcommand(), b''.join( data ) )
+        self._check( SLMP_CMD['READ_R'], payload, len( words ) * 2 + len( dwords ) * 4 )
+        return NP.frombuffer( payload, '<u2', len( words ) ), \
+               NP.frombuffer( payload, '<u4', len( dwords ), len( words ) * 2 )
+
+    async def randomWrite ( self, words, dwords=() ) :
+        # ( device, value ) pairs
+        if not 0 < len( words ) + len( dwords ) <= SLMP_SIZE['RANDOM'] :
+            raise ValueError( 'wrong number of devices : {} : {}'.format( len( words ), len( dwords ) ) )
+        data = [ struct.pack( '<BB', len( words ), len( dwords ) ) ] + \
+               [ self._device( device ) + struct.pack( '<H', value & 0xFFFF ) for device, value in words ] + \
+               [ self._device( device ) + struct.pack( '<I', value & 0xFFFFFFFF ) for device, value in dwords ]
+        await self.request( SLMP_CMD['WRITE_R'], self._subcommand(), b''.join( data ) )
+
+    async def randomWriteBits ( self, bits ) :
+        # ( device, value ) pairs, iQ-R takes 2 bytes for each value
+        if not 0 < len( bits ) <= SLMP_SIZE['RANDOM'] :
+            raise ValueError( 'wrong number of devices : {}'.format( len( bits ) ) )
+        value_format = '<H' if self.series == 'R' else '<B'
+        data = [ struct.pack( '<B', len( bits ) ) ] + \
+               [ self._device( device ) + struct.pack( value_format, int( bool( value ) ) ) for device, value in bits ]
+        await self.request( SLMP_CMD['WRITE_R'], self._subcommand( True ), b''.join( data ) )
+
+    def _blocks ( self, words, bits ) :
+        # ( device, points ) blocks, bit blocks are counted in words of 16 bits
+        points = sum( [ p for _, p in words ] ) + sum( [ p for _, p in bits ] )
+        if not 0 < len( words ) + len( bits ) <= SLMP_SIZE['BLOCK'] or points > SLMP_SIZE['BATCH'] :
+            raise ValueError( 'wrong number of blocks or points : {} : {}'.format( len( words ) + len( bits ), points ) )
+        return points
+
+    async def blockRead ( self, words, bits=() ) :
+        # raw words of each word block, arrays of bools of each bit block
+        points = self._blocks( words, bits )
+        data = [ struct.pack( '<BB', len( words ), len( bits ) ) ] + \
+               [ self._device( device ) + struct.pack( '<H', p ) for device, p in list( words ) + list( bits ) ]
+        payload = await self.request( SLMP_CMD['READ_B'], self._subcommand(), b''.join( data ) )
+        self._check( SLMP_CMD['READ_B'], payload, points * 2 )
+        word_values = [ ]
+        bit_values = [ ]
+        offset = 0
+        for _, p in words :
+            word_values.append( payload[offset:offset+p*2] )
+            offset += p * 2
+        for _, p in bits :
+            bit_values.append( NP.unpackbits( NP.frombuffer( payload, 'u1', p * 2, offset ), bitorder='little' )
+                               .astype( bool ) )
+            offset += p * 2
+        return word_values, bit_values
+
+    async def blockWrite ( self, words, bits=() ) :
+        # ( device, values ) blocks, the bits of each bit block are padded to a multiple of 16
+        word_data = [ pack_words( values ) for _, values in words ]
+        bit_data = [ ]
+        for _, values in bits :
+            values = NP.asarray( values, dtype=bool )
+            bit_data.append( NP.packbits( NP.append( values, NP.zeros( -len( values ) % 16, bool ) ),
+                                          bitorder='little' ).tobytes() )
+        self._blocks( [ ( d, len( b ) // 2 ) for ( d, _ ), b in zip( words, word_data ) ],
+                      [ ( d, len( b ) // 2 ) for ( d, _ ), b in zip( bits, bit_data ) ] )
+        data = [ struct.pack( '<BB', len( words ), len( bits ) ) ] + \
+               [ self._device( device ) + struct.pack( '<H', len( b ) // 2 ) + b
+                 for ( device, _ ), b in list( zip( words, word_data ) ) + list( zip( bits, bit_data ) ) ]
+        await self.request( SLMP_CMD['WRITE_B'], self._subcommand(), b''.join( data ) )
+
+    #-------------------------------------------------------------------------------------------------------------------
+    async def readFrame ( self, frame ) :
+        # raw payload of a frame of a read plan from loader.compile_plan
+        if frame['cmd'] == 'block' :
+            words = frame.get( 'words', [ ] )
+            bits = frame.get( 'bits', [ ] )
+            points = self._blocks( [ ( b, b['points'] ) for b in words ], [ ( b, b['points'] ) for b in bits ] )
+            data = [ struct.pack( '<BB', len( words ), len( bits ) ) ] + \
+                   [ self._device( b ) + struct.pack( '<H', b['points'] ) for b in words + bits ]
+            payload = await self.request( SLMP_CMD['READ_B'], self._subcommand(), b''.join( data ) )
+            return self._check( SLMP_CMD['READ_B'], payload, points * 2 )
+        words = frame.get( 'words', [ ] )
+        dwords = frame.get( 'dwords', [ ] )
+        if not 0 < len( words ) + len( dwords ) <= SLMP_SIZE['RANDOM'] :
+            raise ValueError( 'wrong number of devices : {} : {}'.format( len( words ), len( dwords ) ) )
+        data = [ struct.pack( '<BB', len( words ), len( dwords ) ) ] + [ self._device( p ) for p in words + dwords ]
+        payload = await self.request( SLMP_CMD['READ_R'], self._subcommand(), b''.join( data ) )
+        return self._check( SLMP_CMD['READ_R'], payload, len( words ) * 2 + len( dwords ) * 4 )
+
+    async def readPlan ( self, plan ) :
+        # raw payloads of every frame of a read plan, in the order of the frames, all sent at once
+        if plan['type'] != 'read' :
+            raise ValueError( 'not a read plan : {}'.format( plan['type'] ) )
+        return await asyncio.gather( *[ self.readFrame( frame ) for frame in plan['frames'] ] )
+
+
+#-----------------------------------------------------------------------------------------------------------------------
+class SLMPClient ( SLMPCommands ) :
+    # one TCP or UDP connection, series is 'Q' (Q/L) or 'R' (iQ-R), asked to the CPU on connect if None
+
+    def __init__ ( self, host, port=5007, frame='4e', protocol='tcp', series=None, window=SLMP_WINDOW,
+                   timeout=SOCKET_ARGS['DATA_TIMEOUT'], conn_timeout=SOCKET_ARGS['CONN_TIMEOUT'],
+                   timer=SLMP_ARGS['MNTR_TIMER'], dest=None ) :
+        if frame not in ( '3e', '4e' ) or protocol not in ( 'tcp', 'udp' ) :
+            raise ValueError( 'unsupported frame or protocol : {} : {}'.format( frame, protocol ) )
+        self.host = host
+        self.port = port
+        self.frame = frame
+        self.protocol = protocol
+        self.series = series
+        self.cpu_type = None
+        # responses to 3E frames can only be matched in order
+        self.window = window if frame == '4e' else 1
+        self.timeout = timeout
+        self.conn_timeout = conn_timeout
+        self.timer = timer
+        self.dest = dest
+        self.transport = None
+        self.serial = 0
+        self.pending = { }  # serial -> future, in order of request
+        self.load = 0  # requests sent or waiting for a slot
+        self.slots = None
+        self.connecting = None
+
+    @property
+    def connected ( self ) :
+        return self.transport is not None
+
+    async def connect ( self ) :
+        # connections are shared by the concurrent requests, only the first one opens it
+        if self.connecting is None :
+            self.connecting = asyncio.ensure_future( self._connect() )
+        try :
+            await asyncio.shield( self.connecting )
+        finally :
+            if self.connecting.done() :
+                self.connecting = None
+
+    async def _connect ( self ) :
+        loop = asyncio.get_running_loop()
+        if self.protocol == 'udp' :
+            connection = loop.create_datagram_endpoint( lambda: SLMPDatagram( self ),
+                                                        remote_addr=( self.host, self.port ) )
+        else :
+            connection = loop.create_connection( lambda: SLMPStream( self ), self.host, self.port )
+        self.transport, _ = await asyncio.wait_for( connection, self.conn_timeout )
+        self.slots = asyncio.Semaphore( self.window )
+        if self.series is None :
+            self.cpu_type = await self.getCpuType()
+            self.series = 'R' if self.cpu_type['type'].startswith( 'R' ) else 'Q'
+
+    def close ( self ) :
+        if self.transport is not None :
+            self.transport.close()
+        self.lost( None )
+
+    async def __aenter__ ( self ) :
+        await self.connect()
+        return self
+
+    async def __aexit__ ( self, *exc ) :
+        self.close()
+
+    #-------------------------------------------------------------------------------------------------------------------
+    async def request ( self, command, subcommand=0, data=b'' ) :
+        # payload of the response, raises SLMPError on an end code other than 0
+        self.load += 1
+        try :
+            if self.transport is None :
+                await self.connect()
+            async with self.slots :
+                if self.transport is None :
+                    raise ConnectionError( 'not connected to {}:{}'.format( self.host, self.port ) )
+                serial = self.serial
+                self.serial = ( serial + 1 ) & 0xFFFF
+                future = asyncio.get_running_loop().create_future()
+                self.pending[ serial ] = future
+                self.send( encode_request( command, subcommand, data,
+                                           serial if self.frame == '4e' else None, self.timer, self.dest ) )
+                try :
+                    code, payload = await asyncio.wait_for( future, self.timeout )
+                except asyncio.TimeoutError :
+                    self.pending.pop( serial, None )
+                    if self.frame == '3e' :
+                        # a late response would be matched to the next request
+                        self.close()
+                    raise
+        finally :
+            self.load -= 1
+        if code :
+            raise SLMPError( 'end code 0x{:04X} of command 0x{:04X}'.format( code, command ), code, command, payload )
+        return payload
+
+    def send ( self, frame ) :
+        if self.protocol == 'udp' :
+            self.transport.sendto( frame )
+        else :
+            self.transport.write( frame )
+
+    def response ( self, frame ) :
+        try :
+            serial, code, payload = decode_response( frame )
+        except ( KeyError, IndexError ) :
+            return
+        if serial is None :
+            serial = next( iter( self.pending ), None )
+        future = self.pending.pop( serial, None )
+        if future is not None and not future.done() :
+            future.set_result( ( code, payload ) )
+
+    def lost ( self, exc ) :
+        if self.transport is not None and exc is not None :
+            self.transport.abort()
+        self.transport = None
+        pending, self.pending = self.pending, { }
+        for future in pending.values() :
+            if not future.done() :
+                future.set_exception( ConnectionError( 'connection to {}:{} lost : {}'.format(
+                    self.host, self.port, exc ) ) )
+
+
+class SLMPPool ( SLMPCommands ) :
+    # connections to the same PLC, each request goes to the least loaded one
+
+    def __init__ ( self, host, port=5007, size=SLMP_POOL, **options ) :
+        self.clients = [ SLMPClient( host, port, **options ) for _ in range( size ) ]
+        self.next = 0
+
+    @property
+    def series ( self ) :
+        return self.clients[0].series
+
+    @property
+    def cpu_type ( self ) :
+        return self.clients[0].cpu_type
+
+    async def connect ( self ) :
+        # the first connection finds out the CPU series
+        await self.clients[0].connect()
+        for client in self.clients[1:] :
+            client.series = self.series
+            client.cpu_type = self.cpu_type
+        await asyncio.gather( *[ client.connect() for client in self.clients[1:] ] )
+
+    def close ( self ) :
+        for client in self.clients :
+            client.close()
+
+    async def __aenter__ ( self ) :
+        await self.connect()
+        return self
+
+    async def __aexit__ ( self, *exc ) :
+        self.close()
+
+    async def request ( self, command, subcommand=0, data=b'' ) :
+        # round robin between the clients with the lowest load
+        n = len( self.clients )
+        client = min( [ self.clients[ ( self.next + i ) % n ] for i in range( n ) ], key=lambda c: c.load )
+        self.next = ( self.clients.index( client ) + 1 ) % n
+        return await client.request( command, subcommand, data )
+
+
+#-----------------------------------------------------------------------------------------------------------------------
+def _parse_reads ( reads ) :
+    # 'D100:10' -> ( 'D100', 10 )
+    result = [ ]
+    for read in reads :
+        head, _, points = read.partition( ':' )
+        result.append( ( head, int( points or 1 ) ) )
+    return result
+
+async def main ( args ) :
+    options = { 'frame': args.frame, 'protocol': 'udp' if args.udp else 'tcp', 'series': args.series,
+                'timeout': args.timeout }
+    async with SLMPPool( args.host, args.port, args.connections, **options ) as pool :
+        result = { 'cpu_type': pool.cpu_type, 'series': pool.series }
+        for head, points in _parse_reads( args.read ) :
+            bit = SLMP_COMPATIBLE_DEVICES[ parse_address( head ).type ]['size'] < 1
+            values = await pool.batchRead( head, points, bit )
+            result[ head ] = values.tolist() if bit else NP.frombuffer( values, '<u2' ).tolist()
+        if args.plan :
+            with open( args.plan ) as plan_file :
+                plan = json.load( plan_file )['read']
+            seconds = None
+            for _ in range( args.repeat ) :
+                start = perf_counter()
+                payloads = await pool.readPlan( plan )
+                elapsed = perf_counter() - start
+                seconds = elapsed if seconds is None else min( seconds, elapsed )
+            result['plan'] = { 'frames': len( payloads ), 'bytes': sum( [ len( p ) for p in payloads ] ),
+                               'seconds': seconds }
+    return result
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser( description='Read devices or a loader access plan from a PLC over SLMP' )
+    parser.add_argument( 'host' )
+    parser.add_argument( 'read', nargs='*', help='head device and points, e.g. D100:10 M0:16' )
+    parser.add_argument( '-p', '--port', type=int, default=5007 )
+    parser.add_argument( '--frame', choices=[ '3e', '4e' ], default='4e' )
+    parser.add_argument( '--udp', action='store_true' )
+    parser.add_argument( '--series', choices=[ 'Q', 'R' ], help='CPU series, asked to the CPU if missing' )
+    parser.add_argument( '-c', '--connections', type=int, default=SLMP_POOL )
+    parser.add_argument( '--timeout', type=float, default=SOCKET_ARGS['DATA_TIMEOUT'] )
+    parser.add_argument( '--plan', help='access plan written by loader.py --plan, its read frames are timed' )
+    parser.add_argument( '--repeat', type=int, default=1, help='timed reads of the plan, the best one is kept' )
+    args = parser.parse_args()
+    json.dump( asyncio.run( main( args ) ), sys.stdout, indent=4 )
+    print()
@@ -286,6 +286,7 @@ module.exports = {
     SLMP_ARGS: SLMP_ARGS,
     SLMP_CMD: SLMP_CMD,
     SLMP_CODE: SLMP_CODE,
+    SLMP_DEV: SLMP_DEV,
     SLMP_OFFSET: SLMP_OFFSET,
     SLMP_SIZE: SLMP_SIZE,
     SLMP_TYPE: SLMP_TYPE,
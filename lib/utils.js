@@ -6,7 +6,42 @@
 //=====================================================================================================================
 // Import standard libraries
 const { cloneDeep, result } = require("lodash");
-const { TYPE_ENCODER, TYPE_DECODER, TYPE_SIZE } = require("./const.js");
+const { TYPE_ENCODER, TYPE_DECODER, TYPE_SIZE, SLMP_DEV } = require("./const.js");
+
+//---------------------------------------------------------------------------------------------
+/**
+ * Rebuilds the elements of a compact array of structs ("element" and "strides" in the JSON).
+ * Element n is the first element with the address of each leaf moved by n times its stride.
+ *
+ * @param {Object} data - A variable object from JSON, with "element" and "strides".
+ * @returns {Object} The same variable with "struct" nested by dimension, like the non compact JSON.
+ */
+function expandElements(data) {
+	const shiftElement = (members, n, strides, index) => members.map(member => {
+		const result = index ? {index: index, ...member} : {...member};
+		if (member.struct)
+			result.struct = shiftElement(member.struct, n, strides);
+		else if (member.address && member.address.type) {
+			const address = result.address = {...member.address};
+			address.index += n * strides.shift();
+			address.source = address.type + address.index.toString(SLMP_DEV[address.type].base).toUpperCase() +
+				(address.sub !== undefined ? "." + address.sub.toString(16).toUpperCase() : "");
+		}
+		return result;
+	});
+	let n = 0;
+	const nest = (depth, index) => {
+		const pair = data.dimension[depth];
+		const result = [];
+		for (let i = pair[0]; i <= pair[1]; ++i)
+			result.push(depth+1 < data.dimension.length ? nest(depth+1, [...index, i]) :
+				shiftElement(data.element, n++, data.strides.slice(), [...index, i]));
+		return result;
+	};
+	const { element, strides, ...result } = data;
+	result.struct = nest(0, []);
+	return result;
+}
 
 //---------------------------------------------------------------------------------------------
 /**
@@ -19,6 +54,7 @@ const { TYPE_ENCODER, TYPE_DECODER, TYPE_SIZE } = require("./const.js");
  * @returns {Object|Array} The result variable.
  */
 function parseVariable(data) {
+	if (data.element) data = expandElements(data);
 	const result = data.struct && !data.dimension.length ? {} : [];
 	result._ = {encoder: TYPE_ENCODER[data.type.source], decoder: TYPE_DECODER[data.type.source]};
 	Object.keys(data).forEach( k => {